@@ -0,0 +1,127 @@
+"""
+batch analysis: searches many positions given as FENs and reports the best move and score of each one
+positions are read and results written one at a time, so the memory used does not grow with the input
+
+usage:
+    python analysis.py positions.fen                  one FEN per line, results on stdout
+    python analysis.py positions.fen --depth 5 --workers 4
+    cat positions.fen | python analysis.py - --time 0.5
+    python analysis.py positions.fen --static        static evaluation only, in batches (needs NumPy)
+"""
+import argparse
+import itertools
+import multiprocessing
+import sys
+from collections import deque
+
+from chess_ai import ChessAI
+from bitboard_engine import BitboardGameState
+
+
+def read_fens(lines):
+    """Yield the FENs of the lines, skipping empty lines and comments starting with #"""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def analyse_position(fen, depth=4, time_limit=None, node_limit=None):
+    """Search a position and return (fen, best move, score for the side to move)"""
+    # a FEN that cannot be read gives no move and no score, so one bad line does not end a long run
+    try:
+        gs = BitboardGameState.from_fen(fen)
+    except ValueError:
+        return fen, None, None
+    valid_moves = gs.get_valid_moves()
+    if len(valid_moves) == 0:
+        return fen, None, -ChessAI.CHECKMATE_SCORE if gs.check_mate else ChessAI.STALEMATE_SCORE
+    score, best_move, _ = ChessAI.search(gs, valid_moves, depth, time_limit, node_limit)
+    return fen, best_move, score
+
+
+def analyse_positions(fens, depth=4, time_limit=None, node_limit=None, workers=1, backlog=None):
+    """Analyse the FENs of an iterable, yielding (fen, best move, score) in the order of the input"""
+    if workers <= 1:
+        for fen in fens:
+            yield analyse_position(fen, depth, time_limit, node_limit)
+        return
+
+    # only backlog positions are handed to the pool at a time, so a huge input is never read ahead
+    backlog = backlog or workers * 4
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        for fen in fens:
+            pending.append(pool.apply_async(analyse_position, (fen, depth, time_limit, node_limit)))
+            if len(pending) >= backlog:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def evaluate_positions(fens, batch_size=4096, eval_tables=None):
+    """Evaluate the FENs of an iterable without searching, yielding (fen, score for the side to move)"""
+    # the positions are scored a batch at a time with NumPy, instead of setting up a game state for each one
+    from evaluation import DEFAULT_TABLES, encode_fen_board
+    import numpy as np
+    eval_tables = eval_tables or DEFAULT_TABLES
+    fens = iter(fens)
+    while True:
+        batch = list(itertools.islice(fens, batch_size))
+        if not batch:
+            return
+        boards = []
+        valid = []  # the FENs that could be read, None score for the others
+        for fen in batch:
+            try:
+                boards.append(encode_fen_board(fen))
+                valid.append(True)
+            except ValueError:
+                valid.append(False)
+        codes = np.frombuffer(b"".join(boards), dtype=np.int8).reshape(-1, 64)
+        scores = iter(eval_tables.evaluate_batch(codes, ChessAI.PAWN_STRUCTURE).tolist())
+        for fen, is_valid in zip(batch, valid):
+            if not is_valid:
+                yield fen, None
+                continue
+            score = next(scores)
+            yield fen, -score if fen.split()[1:2] == ["b"] else score
+
+
+def format_result(fen, best_move, score):
+    """Write a result as a line: FEN; best move; score"""
+    if score is None:
+        return f"{fen}; error; invalid FEN"
+    if best_move is None:
+        return f"{fen}; none; {score}"
+    return f"{fen}; {best_move.get_uci_notation()}; {score}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="find the best move of every position of a FEN file")
+    parser.add_argument("input", help="file with one FEN per line, - for stdin")
+    parser.add_argument("--depth", type=int, default=4, help="search depth")
+    parser.add_argument("--time", type=float, help="seconds per position")
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--workers", type=int, default=1, help="processes searching positions at once")
+    parser.add_argument("--static", action="store_true", help="only evaluate the positions, without searching")
+    args = parser.parse_args(argv)
+    if args.static:
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            parser.error("--static needs NumPy")
+
+    lines = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    with lines:
+        if args.static:
+            for fen, score in evaluate_positions(read_fens(lines)):
+                print(format_result(fen, None, score) if score is None else f"{fen}; {score}")
+        else:
+            for result in analyse_positions(read_fens(lines), args.depth, args.time, args.nodes, args.workers):
+                print(format_result(*result), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
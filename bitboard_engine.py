@@ -0,0 +1,356 @@
+"""
+bitboard backed version of the chess engine
+it keeps one 64 bit integer per piece type and color next to the usual board,
+and uses precomputed attack tables to generate the valid moves
+"""
+from chess_engine import GameState, PIECE_CODES, END_SHIFT, MOVED_SHIFT, CAPTURED_SHIFT, EN_PASSANT_FLAG, packed_move
+
+# squares are numbered row * 8 + col, so a8 is 0 and h1 is 63,
+# and bit n of a bitboard is set when square n is occupied
+FULL_BOARD = (1 << 64) - 1
+SQUARES = [divmod(square, 8) for square in range(64)]  # (row, col) of every square
+
+
+def bit_squares(bitboard):
+    """Yield the square of every set bit of the bitboard"""
+    while bitboard:
+        lowest_bit = bitboard & -bitboard
+        yield lowest_bit.bit_length() - 1
+        bitboard ^= lowest_bit
+
+
+def leaper_attacks(offsets):
+    """Build an attack table for a piece that jumps by the given (row, col) offsets"""
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        attacks = 0
+        for dir_row, dir_col in offsets:
+            end_row, end_col = row + dir_row, col + dir_col
+            if 0 <= end_row < 8 and 0 <= end_col < 8:
+                attacks |= 1 << (end_row * 8 + end_col)
+        table.append(attacks)
+    return table
+
+
+# directions are (row, col) steps; a positive square step means the nearest blocker is the lowest bit
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+KNIGHT_ATTACKS = leaper_attacks(GameState.knight_directions)
+KING_ATTACKS = leaper_attacks(GameState.king_directions)
+# the squares a pawn of the color attacks from each square
+PAWN_ATTACKS = {
+    "w": leaper_attacks(((-1, -1), (-1, 1))),
+    "b": leaper_attacks(((1, -1), (1, 1))),
+}
+
+# RAYS[direction][square] holds all the squares from the square to the edge of the board
+RAYS = {}
+for _direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+    RAYS[_direction] = []
+    for _square in range(64):
+        _row, _col = divmod(_square, 8)
+        _ray = 0
+        for _i in range(1, 8):
+            _end_row, _end_col = _row + _direction[0] * _i, _col + _direction[1] * _i
+            if not (0 <= _end_row < 8 and 0 <= _end_col < 8):
+                break
+            _ray |= 1 << (_end_row * 8 + _end_col)
+        RAYS[_direction].append(_ray)
+
+# sliding attacks on an empty board, used to find the pieces that could pin
+ROOK_RAYS = [RAYS[(-1, 0)][s] | RAYS[(0, -1)][s] | RAYS[(1, 0)][s] | RAYS[(0, 1)][s] for s in range(64)]
+BISHOP_RAYS = [RAYS[(-1, -1)][s] | RAYS[(-1, 1)][s] | RAYS[(1, -1)][s] | RAYS[(1, 1)][s] for s in range(64)]
+
+# BETWEEN[a][b] holds the squares strictly between two squares on a common line, otherwise 0
+BETWEEN = [[0] * 64 for _ in range(64)]
+for _direction, _rays in RAYS.items():
+    for _square in range(64):
+        for _target in bit_squares(_rays[_square]):
+            BETWEEN[_square][_target] = _rays[_square] & ~_rays[_target] & ~(1 << _target)
+
+
+def sliding_attacks(square, occupied, directions):
+    """Get the squares a slider on the square attacks, stopping at the first blocker on each ray"""
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][square]
+        blockers = ray & occupied
+        if blockers:
+            if direction[0] * 8 + direction[1] > 0:  # ray goes towards higher squares
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAYS[direction][blocker]  # cut off the squares behind the blocker
+        attacks |= ray
+    return attacks
+
+
+def relevant_mask(square, directions):
+    """Get the squares whose occupancy matters to a slider on the square, which leaves out the board edges"""
+    mask = 0
+    for direction in directions:
+        ray = RAYS[direction][square]
+        if ray:
+            edge = (ray & -ray).bit_length() - 1 if direction[0] * 8 + direction[1] < 0 else ray.bit_length() - 1
+            mask |= ray & ~(1 << edge)
+    return mask
+
+
+# sliding attacks are looked up by the occupancy of the relevant squares,
+# and each table is filled in the first time an occupancy comes up
+ROOK_MASKS = [relevant_mask(s, ROOK_DIRECTIONS) for s in range(64)]
+BISHOP_MASKS = [relevant_mask(s, BISHOP_DIRECTIONS) for s in range(64)]
+ROOK_TABLES = [{} for _ in range(64)]
+BISHOP_TABLES = [{} for _ in range(64)]
+
+
+def rook_attacks(square, occupied):
+    """Get the squares a rook on the square attacks"""
+    key = occupied & ROOK_MASKS[square]
+    table = ROOK_TABLES[square]
+    attacks = table.get(key)
+    if attacks is None:
+        attacks = table[key] = sliding_attacks(square, key, ROOK_DIRECTIONS)
+    return attacks
+
+
+def bishop_attacks(square, occupied):
+    """Get the squares a bishop on the square attacks"""
+    key = occupied & BISHOP_MASKS[square]
+    table = BISHOP_TABLES[square]
+    attacks = table.get(key)
+    if attacks is None:
+        attacks = table[key] = sliding_attacks(square, key, BISHOP_DIRECTIONS)
+    return attacks
+
+
+class BitboardGameState(GameState):
+    """Game state that also keeps a bitboard for every piece and generates moves from them"""
+    pieces = ("wP", "wR", "wN", "wB", "wQ", "wK", "bP", "bR", "bN", "bB", "bQ", "bK")
+
+    def __init__(self, eval_tables=None):
+        super().__init__(eval_tables)
+        self.bitboards = {}
+        self.occupancy = {}
+        self.load_bitboards()
+
+    def load_bitboards(self):
+        """Rebuild all the bitboards from the board"""
+        self.bitboards = {piece: 0 for piece in self.pieces}
+        self.occupancy = {"w": 0, "b": 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    bit = 1 << (row * 8 + col)
+                    self.bitboards[piece] |= bit
+                    self.occupancy[piece[0]] |= bit
+
+    def get_pawns(self):
+        return self.bitboards["wP"], self.bitboards["bP"]
+
+    def load_fen(self, fen):
+        """Set up the position of a FEN on the board and on the bitboards"""
+        super().load_fen(fen)
+        self.load_bitboards()
+
+    def load_snapshot(self, data):
+        """Set up the position of a snapshot on the board and on the bitboards"""
+        super().load_snapshot(data)
+        self.load_bitboards()
+
+    def clone(self):
+        gs = super().clone()
+        gs.bitboards = dict(self.bitboards)
+        gs.occupancy = dict(self.occupancy)
+        return gs
+
+    def make_move(self, move):
+        """Make a move on the board and on the bitboards"""
+        squares = self.move_squares(move)
+        before = [self.board[row][col] for row, col in squares]
+        super().make_move(move)
+        self.update_bitboards(squares, before)
+
+    def undo_move(self):
+        """Undo the last move made on the board and on the bitboards"""
+        if len(self.undo_stack) != 0:
+            squares = self.move_squares(self.last_move())
+            before = [self.board[row][col] for row, col in squares]
+            super().undo_move()
+            self.update_bitboards(squares, before)
+
+    @staticmethod
+    def move_squares(move):
+        """Get the squares whose contents a move changes"""
+        if move.is_en_passant_move:
+            return (move.start_row, move.start_col), (move.end_row, move.end_col), (move.start_row, move.end_col)
+        return (move.start_row, move.start_col), (move.end_row, move.end_col)
+
+    def update_bitboards(self, squares, before):
+        """Bring the bitboards of the squares in line with the board"""
+        for (row, col), old_piece in zip(squares, before):
+            new_piece = self.board[row][col]
+            if new_piece != old_piece:
+                bit = 1 << (row * 8 + col)
+                if old_piece != "--":
+                    self.bitboards[old_piece] ^= bit
+                    self.occupancy[old_piece[0]] ^= bit
+                if new_piece != "--":
+                    self.bitboards[new_piece] ^= bit
+                    self.occupancy[new_piece[0]] ^= bit
+
+    def attackers_to(self, square, occupied, color):
+        """Get a bitboard of the pieces of the color that attack the square"""
+        bitboards = self.bitboards
+        queens = bitboards[color + "Q"]
+        enemy = "b" if color == "w" else "w"
+        return ((KNIGHT_ATTACKS[square] & bitboards[color + "N"]) |
+                (KING_ATTACKS[square] & bitboards[color + "K"]) |
+                # a pawn of the color attacks the square from where an enemy pawn on it would attack
+                (PAWN_ATTACKS[enemy][square] & bitboards[color + "P"]) |
+                (rook_attacks(square, occupied) & (bitboards[color + "R"] | queens)) |
+                (bishop_attacks(square, occupied) & (bitboards[color + "B"] | queens))) & occupied
+
+    def in_check(self):
+        """Check if the current player is in check, from the bitboards"""
+        if self.white_to_move:
+            row, col = self.white_king_location
+            return self.attackers_to(row * 8 + col, self.occupancy["w"] | self.occupancy["b"], "b") != 0
+        row, col = self.black_king_location
+        return self.attackers_to(row * 8 + col, self.occupancy["w"] | self.occupancy["b"], "w") != 0
+
+    def get_valid_moves(self, moves=None, captures_only=False):
+        """Get all valid moves for the current player from the bitboards, filling the given move list if there is one"""
+        bitboards = self.bitboards
+        if self.white_to_move:
+            ally_color, enemy_color = "w", "b"
+            king_row, king_col = self.white_king_location
+        else:
+            ally_color, enemy_color = "b", "w"
+            king_row, king_col = self.black_king_location
+        king_square = king_row * 8 + king_col
+        own = self.occupancy[ally_color]
+        enemy = self.occupancy[enemy_color]
+        occupied = own | enemy
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()  # reuse the list instead of allocating a new one
+
+        checkers = self.attackers_to(king_square, occupied, enemy_color)
+        self.in_check_flag = checkers != 0
+
+        # king moves, with the king lifted off the board so it does not hide squares behind it
+        without_king = occupied ^ (1 << king_square)
+        # only the squares of enemy pieces are wanted when generating captures
+        wanted = enemy if captures_only else FULL_BOARD
+        safe_squares = 0
+        for end_square in bit_squares(KING_ATTACKS[king_square] & ~own & wanted):
+            if not self.attackers_to(end_square, without_king, enemy_color):
+                safe_squares |= 1 << end_square
+        self.add_moves(king_square, safe_squares, moves)
+
+        if checkers & (checkers - 1):  # double check, so the king has to move
+            return moves if captures_only else self.set_end_flags(moves)
+
+        # squares the other pieces may move to: anywhere when not in check, otherwise block or capture
+        target_mask = FULL_BOARD & ~own
+        if checkers:
+            checker_square = checkers.bit_length() - 1
+            target_mask &= BETWEEN[king_square][checker_square] | checkers
+
+        # pinned pieces may only move between the king and the pinning piece
+        pin_masks = {}
+        enemy_queens = bitboards[enemy_color + "Q"]
+        snipers = (ROOK_RAYS[king_square] & (bitboards[enemy_color + "R"] | enemy_queens)) | \
+                  (BISHOP_RAYS[king_square] & (bitboards[enemy_color + "B"] | enemy_queens))
+        for sniper_square in bit_squares(snipers):
+            blockers = BETWEEN[king_square][sniper_square] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:  # exactly one allied blocker
+                pin_masks[blockers.bit_length() - 1] = BETWEEN[king_square][sniper_square] | (1 << sniper_square)
+
+        # knights, a pinned knight can never move
+        for square in bit_squares(bitboards[ally_color + "N"]):
+            if square not in pin_masks:
+                self.add_moves(square, KNIGHT_ATTACKS[square] & target_mask & wanted, moves)
+
+        # sliding pieces
+        queens = bitboards[ally_color + "Q"]
+        piece_mask = target_mask & wanted
+        for square in bit_squares(bitboards[ally_color + "R"] | queens):
+            self.add_moves(square, rook_attacks(square, occupied) & piece_mask & pin_masks.get(square, FULL_BOARD), moves)
+        for square in bit_squares(bitboards[ally_color + "B"] | queens):
+            self.add_moves(square, bishop_attacks(square, occupied) & piece_mask & pin_masks.get(square, FULL_BOARD), moves)
+
+        self.get_bitboard_pawn_moves(ally_color, enemy_color, king_square, occupied, target_mask, pin_masks, moves,
+                                     captures_only)
+        return moves if captures_only else self.set_end_flags(moves)
+
+    def get_bitboard_pawn_moves(self, ally_color, enemy_color, king_square, occupied, target_mask, pin_masks, moves,
+                                captures_only=False):
+        """Get all the valid pawn moves from the bitboards"""
+        board = self.board
+        if ally_color == "w":
+            step, start_rank = -8, 0x00FF000000000000  # the second rank for white
+        else:
+            step, start_rank = 8, 0x000000000000FF00  # the seventh rank for black
+        enemy = self.occupancy[enemy_color]
+        ep_square = self.en_passant_possible[0] * 8 + self.en_passant_possible[1] if self.en_passant_possible else -1
+
+        last_rank = 0xFF if ally_color == "w" else 0xFF00000000000000
+        pawn_base = PIECE_CODES[ally_color + "P"] << MOVED_SHIFT
+        enemy_pawn = PIECE_CODES[enemy_color + "P"] << CAPTURED_SHIFT
+
+        for square in bit_squares(self.bitboards[ally_color + "P"]):
+            allowed = target_mask & pin_masks.get(square, FULL_BOARD)
+            move_base = square | pawn_base
+
+            # pushes, of which only promotions count as captures
+            one_step = square + step
+            if not occupied >> one_step & 1 and not (captures_only and not last_rank >> one_step & 1):
+                if allowed >> one_step & 1:
+                    self.add_pawn_move(move_base | one_step << END_SHIFT, last_rank >> one_step & 1, moves)
+                two_step = one_step + step
+                if start_rank >> square & 1 and not occupied >> two_step & 1 and allowed >> two_step & 1:
+                    moves.append(packed_move(move_base | two_step << END_SHIFT))
+
+            # captures
+            attacks = PAWN_ATTACKS[ally_color][square]
+            for end_square in bit_squares(attacks & enemy & allowed):
+                end_row, end_col = SQUARES[end_square]
+                self.add_pawn_move(move_base | end_square << END_SHIFT |
+                                   PIECE_CODES[board[end_row][end_col]] << CAPTURED_SHIFT,
+                                   last_rank >> end_square & 1, moves)
+
+            # en passant, checked by playing it on the occupancy: two pieces leave the same rank at once,
+            # and this also covers pins and captures or blocks of a check
+            if ep_square >= 0 and attacks >> ep_square & 1:
+                captured_square = ep_square - step
+                after = occupied ^ (1 << square) ^ (1 << ep_square) ^ (1 << captured_square)
+                if not self.attackers_to(king_square, after, enemy_color):
+                    moves.append(packed_move(move_base | ep_square << END_SHIFT | enemy_pawn | EN_PASSANT_FLAG))
+
+    def add_moves(self, square, targets, moves):
+        """Add a move from the square to every square of the targets bitboard"""
+        board = self.board
+        row, col = SQUARES[square]
+        move_base = square | PIECE_CODES[board[row][col]] << MOVED_SHIFT
+        for end_square in bit_squares(targets):
+            end_row, end_col = SQUARES[end_square]
+            moves.append(packed_move(move_base | end_square << END_SHIFT |
+                                     PIECE_CODES[board[end_row][end_col]] << CAPTURED_SHIFT))
+
+    def set_end_flags(self, moves):
+        """Set the checkmate and stalemate flags from the valid moves"""
+        if len(moves) == 0:
+            if self.in_check_flag:
+                self.check_mate = True
+            else:
+                self.stale_mate = True
+        else:
+            self.check_mate = False
+            self.stale_mate = False
+        return moves
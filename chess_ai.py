@@ -1,11 +1,493 @@
+import ast
+import os
 import random
+import threading
+import time
+from array import array
+from chess_engine import MOVE_KEY_MASK, MOVE_ID_MASK, MOVED_SHIFT, CAPTURED_SHIFT, PROMOTION_SHIFT
+# multiprocessing, the opening book and the endgame tables are imported on first use, so that
+# importing the engine stays fast for front ends such as uci.py that may never need them
+
+
+class TranspositionTable:
+    """Fixed size table of search results, keyed by the Zobrist key of the position"""
+    # bound types of the stored scores
+    EXACT = 0
+    LOWER_BOUND = 1  # the real score is at least the stored score
+    UPPER_BOUND = 2  # the real score is at most the stored score
+
+    ENTRY_BYTES = 16  # a 64 bit key and a 64 bit packed entry per slot
+    SCORE_OFFSET = 1 << 22  # keeps the packed score positive
+
+    # an entry is packed into 64 bits:
+    #   bits 0-24 best move, bits 25-26 bound, bits 27-32 depth, bits 33-40 age, bits 41-63 score
+    # an age of 0 marks an empty slot
+
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.size = max(1, size_mb * 1024 * 1024 // self.ENTRY_BYTES)
+        self.keys = array("Q", bytes(8 * self.size))
+        self.entries = array("Q", bytes(8 * self.size))
+        self.age = 1
+
+    def new_search(self):
+        """Start a new search, so the entries of earlier searches get replaced first"""
+        self.age = self.age % 255 + 1
+
+    def clear(self):
+        """Empty the whole table"""
+        self.keys = array("Q", bytes(8 * self.size))
+        self.entries = array("Q", bytes(8 * self.size))
+
+    def probe(self, key):
+        """Get (depth, bound, score, best move value) stored for the position, or None"""
+        index = key % self.size
+        entry = self.entries[index]
+        if not entry or self.keys[index] != key:
+            return None
+        return (entry >> 27) & 63, (entry >> 25) & 3, (entry >> 41) - self.SCORE_OFFSET, entry & 0x1FFFFFF
+
+    def store(self, key, depth, bound, score, best_move):
+        """Store a search result, unless the slot holds a deeper result of the current search"""
+        index = key % self.size
+        entry = self.entries[index]
+        # empty slots, the same position, entries of older searches and shallower results are replaced
+        if entry and self.keys[index] != key and (entry >> 33) & 255 == self.age and (entry >> 27) & 63 > depth:
+            return
+        move_value = best_move.value & 0x1FFFFFF if best_move is not None else 0
+        self.keys[index] = key
+        self.entries[index] = move_value | bound << 25 | depth << 27 | self.age << 33 | \
+            (score + self.SCORE_OFFSET) << 41
+
+
+class EvaluationCache:
+    """Fixed size table of evaluation scores, keyed by a Zobrist key, with counters of how often it helps"""
+    ENTRY_BYTES = 16  # a 64 bit key and a 64 bit score per slot
+
+    # an empty slot reads as key 0 and score 0: no position has key 0 apart from the pawn key of a position
+    # without pawns, whose pawn structure scores 0 anyway
+
+    def __init__(self, size_mb=1, ways=1):
+        # the slots are grouped in buckets of ways slots; with one slot per bucket a new entry always replaces
+        # the old one, with more the bucket is kept in order of use and its least recently used entry goes
+        self.size_mb = size_mb
+        self.ways = max(1, ways)
+        self.buckets = max(1, size_mb * 1024 * 1024 // self.ENTRY_BYTES // self.ways)
+        self.size = self.buckets * self.ways
+        self.keys = array("Q", bytes(8 * self.size))
+        self.scores = array("q", bytes(8 * self.size))
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0  # stores that pushed out the entry of another position
+        self.eval_tables = None  # the evaluation tables the scores were computed with
+
+    def use_tables(self, eval_tables):
+        """Get the table ready for scores computed with the evaluation tables, emptying it if they changed"""
+        # the keys only tell positions apart, so scores of other tables must not be found
+        if eval_tables is not self.eval_tables:
+            self.clear()
+            self.eval_tables = eval_tables
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def clear(self):
+        """Empty the whole table and reset the counters"""
+        self.__init__(self.size_mb, self.ways)
+
+    def probe(self, key):
+        """Get the score stored for the key, or None"""
+        self.probes += 1
+        keys = self.keys
+        if self.ways == 1:
+            index = key % self.size
+            if keys[index] != key:
+                return None
+            self.hits += 1
+            return self.scores[index]
+        first = key % self.buckets * self.ways
+        for index in range(first, first + self.ways):
+            if keys[index] == key:
+                self.hits += 1
+                score = self.scores[index]
+                if index != first:  # the entry used last moves to the front of its bucket
+                    keys[first + 1:index + 1] = keys[first:index]
+                    self.scores[first + 1:index + 1] = self.scores[first:index]
+                    keys[first] = key
+                    self.scores[first] = score
+                return score
+        return None
+
+    def store(self, key, score):
+        """Store a score, replacing the entry in its slot or the least recently used entry of its bucket"""
+        self.stores += 1
+        keys = self.keys
+        if self.ways == 1:
+            index = key % self.size
+            self.replacements += keys[index] not in (0, key)
+            keys[index] = key
+            self.scores[index] = score
+            return
+        first = key % self.buckets * self.ways
+        last = first + self.ways - 1
+        index = keys.index(key, first, last + 1) if key in keys[first:last + 1] else last
+        self.replacements += index == last and keys[last] not in (0, key)
+        keys[first + 1:index + 1] = keys[first:index]
+        self.scores[first + 1:index + 1] = self.scores[first:index]
+        keys[first] = key
+        self.scores[first] = score
+
+
+class SearchStats:
+    """Counters and phase timings of one search, collected only while ChessAI.COLLECT_STATS is on"""
+    PHASES = ("move generation", "ordering", "evaluation", "tablebases")
+
+    def __init__(self):
+        self.nodes = 0  # every node, including the quiescence nodes
+        self.quiescence_nodes = 0
+        self.evaluations = 0  # static evaluations of leaves and stand pat scores
+        self.move_generations = 0
+        self.moves_generated = 0
+        self.legality_checks = 0  # looks for a check on the king, apart from those of the move generation
+        self.table_probes = 0
+        self.table_hits = 0
+        self.table_cutoffs = 0  # nodes answered by the transposition table
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0  # beta cutoffs caused by the first move searched, a sign of good ordering
+        self.tablebase_probes = 0
+        self.tablebase_hits = 0
+        self.eval_cache_probes = 0
+        self.eval_cache_hits = 0
+        self.pawn_table_probes = 0
+        self.pawn_table_hits = 0
+        self.iteration_nodes = []  # nodes of every completed iteration
+        self.phase_times = dict.fromkeys(self.PHASES, 0.0)  # seconds spent in each phase
+        self.start_time = time.perf_counter()
+        self.seconds = 0.0
+
+    def add_time(self, phase, start):
+        """Add the time since start, taken from time.perf_counter, to the phase"""
+        self.phase_times[phase] += time.perf_counter() - start
+
+    def add(self, other):
+        """Add the counters and phase times of another search, such as a worker's part of a parallel search"""
+        for name, value in vars(other).items():
+            if isinstance(value, int):
+                setattr(self, name, getattr(self, name) + value)
+        for phase, seconds in other.phase_times.items():
+            self.phase_times[phase] += seconds  # summed over the workers, so more than the time that passed
+
+    def end_iteration(self, nodes):
+        """Record the nodes of a completed iteration, given the nodes of the search so far"""
+        self.iteration_nodes.append(nodes - sum(self.iteration_nodes))
+
+    def finish(self, nodes):
+        self.nodes = nodes
+        self.seconds = time.perf_counter() - self.start_time
+
+    @property
+    def table_hit_rate(self):
+        return self.table_hits / self.table_probes if self.table_probes else 0.0
+
+    @property
+    def table_cutoff_rate(self):
+        return self.table_cutoffs / self.table_probes if self.table_probes else 0.0
+
+    @property
+    def eval_cache_hit_rate(self):
+        return self.eval_cache_hits / self.eval_cache_probes if self.eval_cache_probes else 0.0
+
+    @property
+    def pawn_table_hit_rate(self):
+        return self.pawn_table_hits / self.pawn_table_probes if self.pawn_table_probes else 0.0
+
+    @property
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    @property
+    def effective_branching_factor(self):
+        """Branching factor of a uniform tree as deep as the last iteration and with as many nodes"""
+        if not self.iteration_nodes:
+            return 0.0
+        return self.iteration_nodes[-1] ** (1 / len(self.iteration_nodes))
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        """Get the counters, rates and phase timings as a plain dict"""
+        stats = {name: value for name, value in vars(self).items() if name not in ("phase_times", "start_time")}
+        stats.update(table_hit_rate=self.table_hit_rate, table_cutoff_rate=self.table_cutoff_rate,
+                     eval_cache_hit_rate=self.eval_cache_hit_rate, pawn_table_hit_rate=self.pawn_table_hit_rate,
+                     first_move_cutoff_rate=self.first_move_cutoff_rate,
+                     effective_branching_factor=self.effective_branching_factor,
+                     nodes_per_second=self.nodes_per_second, phase_times=dict(self.phase_times))
+        return stats
+
+    def __str__(self):
+        phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.phase_times.items())
+        return (f"{self.nodes} nodes ({self.quiescence_nodes} quiescence) in {self.seconds:.3f}s, "
+                f"{self.nodes_per_second:.0f} nps, {self.evaluations} evaluations, "
+                f"{self.move_generations} move generations, {self.legality_checks} legality checks, "
+                f"table hits {self.table_hit_rate:.1%} cutoffs {self.table_cutoff_rate:.1%}, "
+                f"eval cache hits {self.eval_cache_hit_rate:.1%}, pawn table hits {self.pawn_table_hit_rate:.1%}, "
+                f"first move cutoffs {self.first_move_cutoff_rate:.1%}, "
+                f"branching factor {self.effective_branching_factor:.2f}, {phases}")
+
+
+class SearchContext:
+    """State of a single search, so that searches do not share anything but the transposition table"""
+    MAX_PLY = 64
+
+    CHECK_INTERVAL = 256  # nodes between two looks at the clock
+
+    def __init__(self, table, time_limit=None, node_limit=None, cancel_event=None, tablebases=None, stats=None,
+                 eval_cache=None, pawn_table=None):
+        self.table = table
+        # EvaluationCaches of the static evaluation by position and of the pawn structure by pawn key,
+        # None to compute the scores every time
+        self.eval_cache = eval_cache
+        self.pawn_table = pawn_table
+        self.nodes = 0
+        self.stats = stats  # SearchStats to fill in, None to leave the search uninstrumented
+        # endgame tables, probed in positions with few enough pieces
+        self.tablebases = tablebases
+        self.tablebase_pieces = tablebases.max_pieces if tablebases is not None else 0
+
+        # budgets: the search stops once the deadline passes or the node limit is reached
+        self.start_time = time.perf_counter()
+        self.deadline = self.start_time + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+        self.next_check = self.CHECK_INTERVAL if node_limit is None else min(self.CHECK_INTERVAL, node_limit)
+        self.stopped = False
+        self.can_stop = False  # the first iteration always runs to the end, so there is a move to play
+        self.cancel_event = cancel_event  # threading.Event set from outside to abandon the search
+
+        # principal variation of the previous iteration, searched first while the search follows it
+        self.previous_pv = []
+        self.follow_pv = False
+        # two killer moves per ply: quiet moves that caused a beta cutoff in a sibling position
+        self.killers = [[0, 0] for _ in range(self.MAX_PLY)]
+        # history scores of quiet moves by side to move and start/end squares
+        self.history = [[0] * 4096, [0] * 4096]
+        # one move list per ply, refilled by get_valid_moves instead of allocating a new list at every node
+        self.move_lists = [[] for _ in range(self.MAX_PLY)]
+
+    def check_limits(self):
+        """Stop the search if it ran out of time or nodes or was cancelled"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self.stopped = True  # a cancelled search stops even in its first iteration
+        elif self.can_stop:
+            if self.node_limit is not None and self.nodes >= self.node_limit:
+                self.stopped = True
+            elif self.deadline is not None and time.perf_counter() >= self.deadline:
+                self.stopped = True
+        self.next_check = self.nodes + self.CHECK_INTERVAL
+        if self.node_limit is not None:
+            self.next_check = min(self.next_check, self.node_limit)
+
+
+class SearchJob:
+    """AI search running on a background thread, polled by the main loop for its move"""
+    running = None  # the last job started; only one search may use the tables and ChessAI at a time
+
+    def __init__(self, gs, valid_moves):
+        # a cancelled job may still be unwinding its search, so it is waited for before this one starts
+        previous = SearchJob.running
+        if previous is not None:
+            previous.cancel()
+            previous.thread.join()
+        SearchJob.running = self
+        # the search plays its moves on a copy of the game state, so the caller can keep drawing the original
+        # the evaluation tables are never changed and are shared instead of copied
+        self.gs = gs.clone()
+        self.valid_moves = list(valid_moves)
+        self.cancel_event = threading.Event()
+        self.best_move = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        self.best_move = ChessAI.find_best_move_min_max(self.gs, self.valid_moves, self.cancel_event)
+
+    def done(self):
+        """Check whether the search has finished"""
+        return not self.thread.is_alive()
+
+    def result(self):
+        """Get the move found by the search, None if it was cancelled"""
+        if self.cancel_event.is_set():
+            return None
+        return self.best_move
+
+    def cancel(self):
+        """Ask the search to stop; it returns within a few hundred nodes and its move is thrown away"""
+        self.cancel_event.set()
+
+
+class ParallelSearch:
+    """Root moves split across a pool of worker processes, each searching its own copy of the game state"""
+    # set in every worker process by init_worker
+    shared_alpha = None  # best score found so far in the current iteration, shared by all the workers
+    shared_stop = None  # set by the main process to stop the workers
+
+    def __init__(self, workers):
+        import multiprocessing
+        self.workers = workers
+        # spawn instead of fork: the search is started from a thread of the game, which is not safe to fork
+        context = multiprocessing.get_context("spawn")
+        self.alpha = context.Value("i", 0)
+        self.stop_event = context.Event()
+        self.pool = context.Pool(workers, ParallelSearch.init_worker, (self.alpha, self.stop_event))
+
+    @staticmethod
+    def init_worker(alpha, stop_event):
+        ParallelSearch.shared_alpha = alpha
+        ParallelSearch.shared_stop = stop_event
+
+    def close(self):
+        """Stop the worker processes"""
+        self.pool.terminate()
+        self.pool.join()
+
+    def search(self, gs, valid_moves, depth, time_limit=None, node_limit=None, cancel_event=None):
+        """Search like ChessAI.search, with every iteration's root moves dealt out to the workers"""
+        # the node limit applies to every worker on its own
+        deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        root_moves = list(valid_moves)
+        score, pv = 0, []
+        if not root_moves:
+            return score, None, pv
+        self.stop_event.clear()
+        # the workers get the position as a snapshot, taken once, and set it up again on their side
+        from evaluation import DEFAULT_TABLES
+        position = (type(gs), gs.snapshot(), None if gs.eval_tables is DEFAULT_TABLES else gs.eval_tables)
+        # the workers collect statistics of their own, added up here after every iteration
+        stats = SearchStats() if ChessAI.COLLECT_STATS else None
+
+        for iteration_depth in range(1, depth + 1):
+            self.alpha.value = -ChessAI.CHECKMATE_SCORE - 1
+            time_left = max(0.0, deadline - time.perf_counter()) if deadline is not None else None
+            can_stop = iteration_depth > 1  # the first iteration always runs to the end, so there is a move to play
+            # the moves are dealt out in order, so every worker starts with one of the most promising moves
+            tasks = [(position, root_moves[i::self.workers], iteration_depth, pv, time_left, node_limit, can_stop,
+                      stats is not None)
+                     for i in range(min(self.workers, len(root_moves)))]
+            pending = self.pool.map_async(ParallelSearch.search_root_moves, tasks)
+            while not pending.ready():
+                pending.wait(0.01)
+                if cancel_event is not None and cancel_event.is_set():
+                    self.stop_event.set()
+            results = []
+            for worker_results, worker_stats in pending.get():
+                results.append(worker_results)
+                if stats is not None:
+                    stats.add(worker_stats)
+            if any(result is None for result in results):
+                break  # the unfinished iteration is thrown away
+            if stats is not None:
+                stats.end_iteration(stats.nodes)
+
+            # a score that did not beat the alpha it was searched with is only an upper bound, so the best
+            # move is the highest exact score; the other moves follow by score in the next iteration
+            root_results = [result for worker_results in results for result in worker_results]
+            root_results.sort(key=lambda result: (result[1], result[0]), reverse=True)
+            root_moves = [result[2][0] for result in root_results]
+            score, pv = root_results[0][0], root_results[0][2]
+            if abs(score) > ChessAI.MATE_SCORE:
+                break  # a forced mate was found, searching deeper will not change it
+
+        if stats is not None:
+            ChessAI.report_stats(stats, stats.nodes)
+        return score, (pv[0] if pv else None), pv
+
+    @staticmethod
+    def search_root_moves(task):
+        """Search some of the root moves in a worker, returning (score, exact, principal variation) for each"""
+        # along with the worker's SearchStats when asked for them; the results are None when it was stopped
+        (cls, snapshot, eval_tables), moves, depth, previous_pv, time_limit, node_limit, can_stop, collect_stats = task
+        gs = cls.from_snapshot(snapshot, eval_tables)
+        table = ChessAI.get_transposition_table()  # every worker keeps its own table between iterations
+        table.new_search()
+        stats = SearchStats() if collect_stats else None
+        context = SearchContext(table, time_limit, node_limit, ParallelSearch.shared_stop, ChessAI.get_tablebases(),
+                                stats, ChessAI.get_eval_cache(gs.eval_tables), ChessAI.get_pawn_table(gs.eval_tables))
+        search = ChessAI.get_search_function(stats)
+        context.can_stop = can_stop
+        context.previous_pv = previous_pv
+        shared_alpha = ParallelSearch.shared_alpha
+
+        results = []
+        for move in moves:
+            alpha = shared_alpha.value  # moves worse than the best one of any worker only need a bound
+            context.follow_pv = bool(previous_pv) and move == previous_pv[0]
+            gs.make_move(move)
+            score, pv = search(gs, context, None, depth - 1, 1, -ChessAI.CHECKMATE_SCORE, -alpha)
+            gs.undo_move()
+            if context.stopped:
+                break
+            score = -score
+            exact = score > alpha
+            if exact:
+                with shared_alpha.get_lock():
+                    if score > shared_alpha.value:
+                        shared_alpha.value = score
+            results.append((score, exact, [move] + pv))
+        if stats is not None:
+            stats.finish(context.nodes)
+        return (None if context.stopped else results), stats
+
 
 class ChessAI:
     # Chess piece values
     piece_scores = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
-    CHECKMATE_SCORE = 1000
+    CHECKMATE_SCORE = 100000  # evaluations are in centipawns
+    # scores past this are mates: those of the search lie within MAX_PLY plies, those of the endgame tables
+    # as far as their 16 bit distances reach, still far beyond any evaluation
+    MATE_SCORE = CHECKMATE_SCORE - SearchContext.MAX_PLY - (1 << 15)
     STALEMATE_SCORE = 0
-    MAX_DEPTH = 3  # Depth for MinMax algorithm
+    MAX_DEPTH = 8  # deepest iteration of the alpha-beta search
+    TIME_LIMIT = 2.0  # seconds per move, None to search every iteration up to MAX_DEPTH
+    NODE_LIMIT = None  # nodes per move, None for no limit
+    TT_SIZE_MB = 16  # memory budget of the transposition table
+    transposition_table = None  # created on first use
+    PAWN_STRUCTURE = True  # add doubled, isolated and passed pawns to the evaluation
+    EVAL_CACHE_SIZE_MB = 4  # memory budget of the evaluation cache, 0 for none
+    PAWN_TABLE_SIZE_MB = 1  # memory budget of the pawn structure table, 0 for none
+    CACHE_WAYS = 1  # entries per bucket of both caches: 1 always replaces, more evict the least recently used
+    eval_cache = None  # created on first use
+    pawn_table = None  # created on first use
+    WORKERS = 1  # processes searching the root moves, 1 searches in the calling process
+    parallel_search = None  # pool of worker processes, created on first use
+    USE_BOOK = True  # play moves from the opening book while the position is in it
+    BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")  # built by opening_book.py
+    opening_book = None  # opened on first use
+    USE_TABLEBASES = True  # look up positions with few pieces in the endgame tables
+    COLLECT_STATS = False  # count and time what every search does, see SearchStats
+    stats_callback = None  # called with the SearchStats at the end of every search while COLLECT_STATS is on
+    last_stats = None  # SearchStats of the last search while COLLECT_STATS is on
+    TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")  # generated by tablebase.py
+    tablebases = None  # opened on first use
+    search_variants_built = False  # see build_search_variants, done on the first search
+
+    # move ordering: the hash move first, then captures by most valuable victim and least valuable
+    # attacker, then promotions, killer moves and the remaining quiet moves by their history score
+    # values are indexed by piece code: empty, wP, wR, wN, wB, wQ, wK, bP, bR, bN, bB, bQ, bK
+    ordering_values = (0, 1, 4, 2, 3, 5, 6, 1, 4, 2, 3, 5, 6)
+    PV_MOVE_ORDER = 1 << 31
+    HASH_MOVE_ORDER = 1 << 30
+    CAPTURE_ORDER = 1 << 28
+    PROMOTION_ORDER = 1 << 27
+    KILLER_ORDER = 1 << 26
+
+    # quiescence search: a capture is skipped when even winning the captured piece for nothing, plus the
+    # margin, would not raise the score to alpha (delta pruning); values are indexed by piece code
+    delta_values = (0, 100, 500, 320, 330, 900, 0, 100, 500, 320, 330, 900, 0)
+    DELTA_MARGIN = 200
 
     # @staticmethod
     # def find_best_move(gs, valid_moves):
@@ -43,51 +525,490 @@ class ChessAI:
     #     return best_player_move
     
     @staticmethod
-    def find_best_move_min_max(gs, valid_moves):
+    def find_best_move_min_max(gs, valid_moves, cancel_event=None):
         """Helper function to make first recursive call."""
-        global next_move
-        next_move = None
-        ChessAI.find_move_min_max(gs, valid_moves , ChessAI.MAX_DEPTH , gs.white_to_move)
-        return next_move
+        book_move = ChessAI.get_book_move(gs, valid_moves)
+        if book_move is not None:
+            return book_move
+        tablebase_move = ChessAI.get_tablebase_move(gs, valid_moves)
+        if tablebase_move is not None:
+            return tablebase_move
+        if ChessAI.WORKERS > 1:
+            return ChessAI.get_parallel_search().search(
+                gs, valid_moves, ChessAI.MAX_DEPTH, ChessAI.TIME_LIMIT, ChessAI.NODE_LIMIT, cancel_event)[1]
+        return ChessAI.search(
+            gs, valid_moves, ChessAI.MAX_DEPTH, ChessAI.TIME_LIMIT, ChessAI.NODE_LIMIT, cancel_event)[1]
+
+    @staticmethod
+    def start_search(gs, valid_moves):
+        """Start searching for the best move in the background and return the job to poll"""
+        return SearchJob(gs, valid_moves)
+
+    @staticmethod
+    def search(gs, valid_moves, depth, time_limit=None, node_limit=None, cancel_event=None, info_callback=None):
+        """Search the position to the depth and return (score, best move, principal variation)"""
+        # iterative deepening: search one ply deeper every iteration until the depth is reached or
+        # the time or node budget runs out, and keep the result of the last completed iteration
+        # the score is from the point of view of the side to move
+        # info_callback(depth, score, nodes, seconds, pv) is called after every completed iteration
+        table = ChessAI.get_transposition_table()
+        table.new_search()
+        stats = SearchStats() if ChessAI.COLLECT_STATS else None
+        context = SearchContext(table, time_limit, node_limit, cancel_event, ChessAI.get_tablebases(), stats,
+                                ChessAI.get_eval_cache(gs.eval_tables), ChessAI.get_pawn_table(gs.eval_tables))
+        root_moves = list(valid_moves)
+        score, pv = 0, []
+        search = ChessAI.get_search_function(stats)
+
+        for iteration_depth in range(1, depth + 1):
+            context.previous_pv = pv
+            context.follow_pv = True
+            iteration_score, iteration_pv = search(
+                gs, context, root_moves, iteration_depth, 0, -ChessAI.CHECKMATE_SCORE, ChessAI.CHECKMATE_SCORE)
+            if context.stopped:
+                break  # the unfinished iteration is thrown away
+            score, pv = iteration_score, iteration_pv
+            context.can_stop = True
+            if stats is not None:
+                stats.end_iteration(context.nodes)
+            if info_callback is not None:
+                info_callback(iteration_depth, score, context.nodes, time.perf_counter() - context.start_time, pv)
+            if abs(score) > ChessAI.MATE_SCORE:
+                break  # a forced mate was found, searching deeper will not change it
+
+        if stats is not None:
+            ChessAI.report_stats(stats, context.nodes)
+        return score, (pv[0] if pv else None), pv
+
+    @staticmethod
+    def report_stats(stats, nodes):
+        """Finish the statistics of a search and hand them on"""
+        stats.finish(nodes)
+        ChessAI.last_stats = stats
+        if ChessAI.stats_callback is not None:
+            ChessAI.stats_callback(stats)
+
+    @staticmethod
+    def get_search_function(stats):
+        """Get the negamax search to run, the instrumented one when there are statistics to collect"""
+        if not ChessAI.search_variants_built:
+            build_search_variants()
+        if stats is None:
+            return ChessAI.find_move_nega_max_alpha_beta
+        return ChessAI.find_move_nega_max_alpha_beta_with_stats
 
     @staticmethod
-    def find_move_min_max(gs, valid_moves, depth, white_to_move):
-        global next_move
+    def get_transposition_table():
+        """Get the transposition table, creating it on first use or after TT_SIZE_MB changed"""
+        if ChessAI.transposition_table is None or ChessAI.transposition_table.size_mb != ChessAI.TT_SIZE_MB:
+            ChessAI.transposition_table = TranspositionTable(ChessAI.TT_SIZE_MB)
+        return ChessAI.transposition_table
 
-        if depth == 0:
-            return ChessAI.score_material(gs.board)
-        
-        if white_to_move:
-            max_score = -ChessAI.CHECKMATE_SCORE
-            for move in valid_moves:
-                gs.make_move(move)
-                next_valid_moves = gs.get_valid_moves()
-                score = ChessAI.find_move_min_max(gs, next_valid_moves, depth - 1, False)
+    @staticmethod
+    def get_eval_cache(eval_tables):
+        """Get the evaluation cache, made ready for the evaluation tables, None without one"""
+        if not ChessAI.EVAL_CACHE_SIZE_MB:
+            return None
+        cache = ChessAI.eval_cache
+        if cache is None or (cache.size_mb, cache.ways) != (ChessAI.EVAL_CACHE_SIZE_MB, ChessAI.CACHE_WAYS):
+            ChessAI.eval_cache = EvaluationCache(ChessAI.EVAL_CACHE_SIZE_MB, ChessAI.CACHE_WAYS)
+        ChessAI.eval_cache.use_tables(eval_tables)
+        return ChessAI.eval_cache
+
+    @staticmethod
+    def get_pawn_table(eval_tables):
+        """Get the pawn structure table, made ready for the evaluation tables, None without one"""
+        if not ChessAI.PAWN_TABLE_SIZE_MB:
+            return None
+        table = ChessAI.pawn_table
+        if table is None or (table.size_mb, table.ways) != (ChessAI.PAWN_TABLE_SIZE_MB, ChessAI.CACHE_WAYS):
+            ChessAI.pawn_table = EvaluationCache(ChessAI.PAWN_TABLE_SIZE_MB, ChessAI.CACHE_WAYS)
+        ChessAI.pawn_table.use_tables(eval_tables)
+        return ChessAI.pawn_table
+
+    @staticmethod
+    def get_book_move(gs, valid_moves):
+        """Pick a move from the opening book, None if there is no book or the position is not in it"""
+        if not ChessAI.USE_BOOK:
+            return None
+        if ChessAI.opening_book is None or ChessAI.opening_book.path != ChessAI.BOOK_PATH:
+            if not os.path.exists(ChessAI.BOOK_PATH):
+                return None
+            from opening_book import OpeningBook
+            if ChessAI.opening_book is not None:
+                ChessAI.opening_book.close()
+            ChessAI.opening_book = OpeningBook(ChessAI.BOOK_PATH)
+        return ChessAI.opening_book.choose_move(gs, valid_moves)
 
-                if score > max_score:
-                    max_score = score
-                    if depth == ChessAI.MAX_DEPTH:
-                        next_move = move        
+    @staticmethod
+    def get_tablebases():
+        """Get the endgame tables, None if they are turned off or none were generated"""
+        if not ChessAI.USE_TABLEBASES:
+            return None
+        if ChessAI.tablebases is None or ChessAI.tablebases.directory != ChessAI.TABLEBASE_PATH:
+            from tablebase import Tablebases
+            if ChessAI.tablebases is not None:
+                ChessAI.tablebases.close()
+            ChessAI.tablebases = Tablebases(ChessAI.TABLEBASE_PATH)
+        return ChessAI.tablebases if ChessAI.tablebases.max_pieces else None
 
-                gs.undo_move()
+    @staticmethod
+    def get_tablebase_move(gs, valid_moves):
+        """Pick the move with the best endgame table result, None if the position is not in the tables"""
+        # the fastest mate when winning, the slowest one when losing, and a move that keeps the draw otherwise
+        tablebases = ChessAI.get_tablebases()
+        if tablebases is None or tablebases.probe(gs) is None:
+            return None
+        best_move = None
+        best_score = -ChessAI.CHECKMATE_SCORE - 1
+        for move in valid_moves:
+            gs.make_move(move)
+            value = tablebases.probe(gs)
+            gs.undo_move()
+            if value is None:
+                return None  # the move leads into a table that was not generated
+            score = -ChessAI.tablebase_score(value, 1)
+            if score > best_score:
+                best_score = score
+                best_move = move
+        return best_move
 
-            return max_score
+    @staticmethod
+    def tablebase_score(value, ply):
+        """Turn an endgame table value into a search score for the side to move"""
+        if value > 0:  # mates in value plies
+            return ChessAI.CHECKMATE_SCORE - (ply + value)
+        if value < 0:  # gets mated in -value - 1 plies
+            return -ChessAI.CHECKMATE_SCORE + ply + (-value - 1)
+        return ChessAI.STALEMATE_SCORE
+
+    @staticmethod
+    def get_parallel_search():
+        """Get the pool of search workers, creating it on first use or after WORKERS changed"""
+        if ChessAI.parallel_search is None or ChessAI.parallel_search.workers != ChessAI.WORKERS:
+            if ChessAI.parallel_search is not None:
+                ChessAI.parallel_search.close()
+            ChessAI.parallel_search = ParallelSearch(ChessAI.WORKERS)
+        return ChessAI.parallel_search
+
+    @staticmethod
+    def find_move_nega_max_alpha_beta(gs, context, valid_moves, depth, ply, alpha, beta):
+        """Negamax search with alpha-beta pruning, returning (score, principal variation)"""
+        if depth == 0:  # the exchanges going on at the horizon are played out before evaluating
+            return ChessAI.quiescence_search(gs, context, ply, alpha, beta)
+        context.nodes += 1
+        if context.nodes >= context.next_check:
+            context.check_limits()
+        if context.stopped:
+            return 0, []
+        stats = context.stats  # every use is behind a None check, see build_search_variants
+        if ply > 0 and gs.piece_count <= context.tablebase_pieces:
+            if stats is not None:
+                start = time.perf_counter()
+            value = context.tablebases.probe(gs)
+            if stats is not None:
+                stats.add_time("tablebases", start)
+                stats.tablebase_probes += 1
+                stats.tablebase_hits += value is not None
+            if value is not None:  # solved ending, no need to search it
+                return ChessAI.tablebase_score(value, ply), []
+
+        # a position reached before through another move order does not have to be searched again
+        table = context.table
+        key = gs.zobrist_key
+        alpha_original = alpha
+        hash_move_value = 0
+        entry = table.probe(key)
+        if stats is not None:
+            stats.table_probes += 1
+            stats.table_hits += entry is not None
+        if entry is not None:
+            entry_depth, bound, score, hash_move_value = entry
+            if entry_depth >= depth and ply > 0:  # the root still needs its move
+                score = ChessAI.score_from_table(score, ply)
+                if bound == TranspositionTable.EXACT or \
+                        (bound == TranspositionTable.LOWER_BOUND and score >= beta) or \
+                        (bound == TranspositionTable.UPPER_BOUND and score <= alpha):
+                    if stats is not None:
+                        stats.table_cutoffs += 1
+                    return score, []
+
+        # while on the principal variation of the previous iteration its move is searched first
+        pv_move_value = 0
+        if context.follow_pv:
+            if ply < len(context.previous_pv):
+                pv_move_value = context.previous_pv[ply].value
+            else:
+                context.follow_pv = False
+        order = ChessAI.get_order_key(context, ply, hash_move_value, pv_move_value, gs.white_to_move)
+        if valid_moves is None:
+            # moves are only generated once the table could not answer for the position, and then a stage
+            # at a time: the pv and hash moves, captures, killers and the quiet moves, so a cutoff by an
+            # early move saves generating and sorting the others
+            moves = gs.get_staged_moves((pv_move_value, hash_move_value), tuple(context.killers[ply]), order)
+            if stats is not None:
+                stats.move_generations += 1
+                moves = ChessAI.timed_moves(moves, stats)
         else:
-            min_score = ChessAI.CHECKMATE_SCORE
-            for move in valid_moves:
-                gs.make_move(move)
-                next_valid_moves = gs.get_valid_moves()
-                score = ChessAI.find_move_min_max(gs, next_valid_moves, depth - 1, True)
-                
-                if score < min_score:
-                    min_score = score
-                    if depth == ChessAI.MAX_DEPTH:
-                        next_move = move
-                
-                gs.undo_move()
-            
-            return min_score
-        
+            if stats is not None:
+                start = time.perf_counter()
+            valid_moves.sort(key=order, reverse=True)
+            if stats is not None:
+                stats.add_time("ordering", start)
+            moves = valid_moves
+
+        max_score = -ChessAI.CHECKMATE_SCORE - 1
+        best_move = None
+        best_pv = []
+        moves_searched = 0
+        for move in moves:
+            moves_searched += 1
+            gs.make_move(move)
+            score, pv = ChessAI.find_move_nega_max_alpha_beta(gs, context, None, depth - 1, ply + 1, -beta, -alpha)
+            score = -score
+            gs.undo_move()
+            context.follow_pv = False  # only the first move of a node can continue the variation
+            if context.stopped:
+                return 0, []
+
+            if score > max_score:
+                max_score = score
+                best_move = move
+                best_pv = [move] + pv
+            if max_score > alpha:
+                alpha = max_score
+            if alpha >= beta:  # the opponent will not allow this position, so stop searching it
+                if not move.value >> CAPTURED_SHIFT & 15:
+                    ChessAI.update_quiet_move_scores(context, move, ply, depth, gs.white_to_move)
+                if stats is not None:
+                    stats.beta_cutoffs += 1
+                    stats.first_move_cutoffs += moves_searched == 1
+                break
+
+        if moves_searched == 0:  # the flags were set when the last stage found no moves
+            if gs.check_mate:
+                score = -ChessAI.CHECKMATE_SCORE + ply  # the sooner the mate, the worse for the side to move
+            else:
+                score = ChessAI.STALEMATE_SCORE
+            table.store(key, depth, TranspositionTable.EXACT, ChessAI.score_to_table(score, ply), None)
+            return score, []
+
+        if max_score <= alpha_original:
+            bound = TranspositionTable.UPPER_BOUND
+        elif max_score >= beta:
+            bound = TranspositionTable.LOWER_BOUND
+        else:
+            bound = TranspositionTable.EXACT
+        table.store(key, depth, bound, ChessAI.score_to_table(max_score, ply), best_move)
+        return max_score, best_pv
+
+    @staticmethod
+    def quiescence_search(gs, context, ply, alpha, beta):
+        """Search only captures and promotions until the position is quiet, returning (score, principal variation)"""
+        context.nodes += 1
+        if context.nodes >= context.next_check:
+            context.check_limits()
+        if context.stopped:
+            return 0, []
+        stats = context.stats
+        if stats is not None:
+            stats.quiescence_nodes += 1
+        turn_multiplier = 1 if gs.white_to_move else -1
+        if ply >= SearchContext.MAX_PLY - 1:
+            return turn_multiplier * ChessAI.evaluate(gs, context), []
+        if gs.piece_count <= context.tablebase_pieces:
+            if stats is not None:
+                start = time.perf_counter()
+            value = context.tablebases.probe(gs)
+            if stats is not None:
+                stats.add_time("tablebases", start)
+                stats.tablebase_probes += 1
+                stats.tablebase_hits += value is not None
+            if value is not None:
+                return ChessAI.tablebase_score(value, ply), []
+
+        if stats is not None:
+            start = time.perf_counter()
+        in_check = gs.in_check()
+        if stats is not None:
+            stats.add_time("move generation", start)
+            stats.legality_checks += 1
+        if in_check:  # standing pat is no option in check, so every evasion is searched
+            if stats is not None:
+                start = time.perf_counter()
+            moves = gs.get_valid_moves(context.move_lists[ply])
+            if stats is not None:
+                stats.add_time("move generation", start)
+                stats.move_generations += 1
+                stats.moves_generated += len(moves)
+            if len(moves) == 0:
+                return -ChessAI.CHECKMATE_SCORE + ply, []
+            stand_pat = max_score = -ChessAI.CHECKMATE_SCORE - 1
+        else:
+            # stand pat: the side to move does not have to capture, so the static score is a lower bound
+            # and the captures are only generated when it does not cause a cutoff on its own
+            if stats is not None:
+                start = time.perf_counter()
+            stand_pat = max_score = turn_multiplier * ChessAI.evaluate(gs, context)
+            if stats is not None:
+                stats.add_time("evaluation", start)
+                stats.evaluations += 1
+            if stand_pat >= beta:
+                return stand_pat, []
+            if stand_pat > alpha:
+                alpha = stand_pat
+            if stats is not None:
+                start = time.perf_counter()
+            moves = gs.get_capture_moves(context.move_lists[ply])
+            if stats is not None:
+                stats.add_time("move generation", start)
+                stats.move_generations += 1
+                stats.moves_generated += len(moves)
+        if stats is not None:
+            start = time.perf_counter()
+        ChessAI.order_moves(moves, context, ply, 0, 0, gs.white_to_move)
+        if stats is not None:
+            stats.add_time("ordering", start)
+
+        best_pv = []
+        delta_values = ChessAI.delta_values
+        for move in moves:
+            value = move.value
+            if not in_check:
+                promotion = value >> PROMOTION_SHIFT & 7
+                if promotion > 1:
+                    continue  # underpromotions are left to the full-width search
+                if not promotion and \
+                        stand_pat + delta_values[value >> CAPTURED_SHIFT & 15] + ChessAI.DELTA_MARGIN <= alpha:
+                    continue
+            gs.make_move(move)
+            score, pv = ChessAI.quiescence_search(gs, context, ply + 1, -beta, -alpha)
+            score = -score
+            gs.undo_move()
+            if context.stopped:
+                return 0, []
+
+            if score > max_score:
+                max_score = score
+                best_pv = [move] + pv
+            if max_score > alpha:
+                alpha = max_score
+            if alpha >= beta:
+                if stats is not None:
+                    stats.beta_cutoffs += 1
+                    stats.first_move_cutoffs += move is moves[0]
+                break
+        return max_score, best_pv
+
+    @staticmethod
+    def score_to_table(score, ply):
+        """Store mate scores as distance from the position instead of from the root"""
+        if score > ChessAI.MATE_SCORE:
+            return score + ply
+        if score < -ChessAI.MATE_SCORE:
+            return score - ply
+        return score
+
+    @staticmethod
+    def score_from_table(score, ply):
+        """Turn a stored mate score back into a distance from the root"""
+        if score > ChessAI.MATE_SCORE:
+            return score - ply
+        if score < -ChessAI.MATE_SCORE:
+            return score + ply
+        return score
+
+    @staticmethod
+    def order_moves(moves, context, ply, hash_move_value, pv_move_value, white_to_move):
+        """Sort the moves so the ones most likely to cause a cutoff are searched first"""
+        moves.sort(key=ChessAI.get_order_key(context, ply, hash_move_value, pv_move_value, white_to_move), reverse=True)
+
+    @staticmethod
+    def get_order_key(context, ply, hash_move_value, pv_move_value, white_to_move):
+        """Get the sort key of the moves of a node, higher for the moves more likely to cause a cutoff"""
+        pv_move_key = pv_move_value & MOVE_KEY_MASK if pv_move_value else -1
+        hash_move_key = hash_move_value & MOVE_KEY_MASK if hash_move_value else -1
+        killers = context.killers[ply]
+        history = context.history[0 if white_to_move else 1]
+        values = ChessAI.ordering_values
+
+        def order(move):
+            value = move.value
+            if value & MOVE_KEY_MASK == pv_move_key:
+                return ChessAI.PV_MOVE_ORDER
+            if value & MOVE_KEY_MASK == hash_move_key:
+                return ChessAI.HASH_MOVE_ORDER
+            captured = value >> CAPTURED_SHIFT & 15
+            if captured:  # most valuable victim, least valuable attacker
+                return ChessAI.CAPTURE_ORDER + values[captured] * 8 - values[value >> MOVED_SHIFT & 15]
+            if value >> PROMOTION_SHIFT & 7:
+                return ChessAI.PROMOTION_ORDER
+            move_key = value & MOVE_KEY_MASK
+            if move_key == killers[0] or move_key == killers[1]:
+                return ChessAI.KILLER_ORDER
+            return history[value & MOVE_ID_MASK]
+
+        return order
+
+    @staticmethod
+    def timed_moves(moves, stats):
+        """Pass on the moves of a staged move generator, adding the time spent generating them to the stats"""
+        moves = iter(moves)
+        while True:
+            start = time.perf_counter()
+            move = next(moves, None)
+            stats.add_time("move generation", start)
+            if move is None:
+                return
+            stats.moves_generated += 1
+            yield move
+
+    @staticmethod
+    def update_quiet_move_scores(context, move, ply, depth, white_to_move):
+        """Remember a quiet move that caused a cutoff as a killer move and in the history scores"""
+        move_key = move.value & MOVE_KEY_MASK
+        killers = context.killers[ply]
+        if killers[0] != move_key:
+            killers[1] = killers[0]
+            killers[0] = move_key
+        history = context.history[0 if white_to_move else 1]
+        history[move.value & MOVE_ID_MASK] += depth * depth
+
+    @staticmethod
+    def evaluate(gs, context):
+        """Get the static evaluation of the position in centipawns, positive when white is better"""
+        if not ChessAI.PAWN_STRUCTURE:
+            return gs.get_evaluation()  # the running scores alone cost less than a cache lookup
+        stats = context.stats
+        eval_cache = context.eval_cache
+        if eval_cache is not None:
+            score = eval_cache.probe(gs.zobrist_key)
+            if stats is not None:
+                stats.eval_cache_probes += 1
+                stats.eval_cache_hits += score is not None
+            if score is not None:
+                return score
+
+        # the pawn structure only depends on the pawns, so it is shared by all the positions with the same ones;
+        # its middlegame and endgame scores are stored as one int, the middlegame score in the high 32 bits
+        pawn_table = context.pawn_table
+        packed = None
+        if pawn_table is not None:
+            packed = pawn_table.probe(gs.pawn_key)
+            if stats is not None:
+                stats.pawn_table_probes += 1
+                stats.pawn_table_hits += packed is not None
+        if packed is None:
+            pawn_mg, pawn_eg = gs.eval_tables.evaluate_pawns(*gs.get_pawns())
+            if pawn_table is not None:
+                pawn_table.store(gs.pawn_key, pawn_mg << 32 | pawn_eg & 0xFFFFFFFF)
+        else:
+            pawn_mg, pawn_eg = packed >> 32, ((packed & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+
+        score = gs.eval_tables.blend(gs.mg_score + pawn_mg, gs.eg_score + pawn_eg, gs.phase)
+        if eval_cache is not None:
+            eval_cache.store(gs.zobrist_key, score)
+        return score
 
     @staticmethod
     def score_board(gs):
@@ -102,17 +1023,9 @@ class ChessAI:
             
         elif gs.stale_mate:
             return ChessAI.STALEMATE_SCORE
-        
 
-        score = 0
-        for row in gs.board:
-            for square in row:
-                if square[0] == "w":
-                    score += ChessAI.piece_scores[square[1]]
-                elif square[0] == "b":
-                    score -= ChessAI.piece_scores[square[1]]
-
-        return score
+        # material and piece-square scores kept up to date by the game state
+        return gs.get_evaluation()
 
     @staticmethod
     def score_material(board):
@@ -126,3 +1039,77 @@ class ChessAI:
                     score -= ChessAI.piece_scores[square[1]]
 
         return score
+
+
+class SearchVariant(ast.NodeTransformer):
+    """Rewrites a search function into its plain or its instrumented variant, see build_search_variants"""
+
+    def __init__(self, with_stats):
+        self.with_stats = with_stats
+
+    @staticmethod
+    def is_stats_check(node):
+        return isinstance(node, ast.Compare) and isinstance(node.left, ast.Name) and node.left.id == "stats" and \
+            isinstance(node.ops[0], ast.IsNot)
+
+    def visit_FunctionDef(self, node):
+        node.decorator_list = []
+        if self.with_stats:
+            node.name += "_with_stats"
+        return self.generic_visit(node)
+
+    def visit_If(self, node):
+        if not self.with_stats and self.is_stats_check(node.test) and not node.orelse:
+            return ast.copy_location(ast.Pass(), node)  # a pass compiles to nothing
+        return self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        if not self.with_stats and [getattr(target, "id", None) for target in node.targets] == ["stats"]:
+            return ast.copy_location(ast.Pass(), node)
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        # the instrumented functions call each other
+        if self.with_stats and isinstance(node.value, ast.Name) and node.value.id == "ChessAI" and \
+                node.attr in SEARCH_FUNCTIONS:
+            node.attr += "_with_stats"
+        return self.generic_visit(node)
+
+
+# the search functions are written once, with everything about SearchStats behind "if stats is not None";
+# the search runs a copy compiled without those checks, so it pays nothing while COLLECT_STATS is off, and
+# searches collecting statistics run the functions as written, as ChessAI.<name>_with_stats
+# the copies are compiled on the first search rather than on import, which keeps the UCI start quick
+SEARCH_FUNCTIONS = ("find_move_nega_max_alpha_beta", "quiescence_search", "evaluate")
+
+
+def build_search_variants():
+    """Compile the plain and the instrumented variants of the search functions"""
+    try:
+        with open(__file__, encoding="utf-8") as source_file:
+            lines = source_file.read().splitlines()
+    except OSError:
+        lines = None
+    for name in SEARCH_FUNCTIONS:
+        function = vars(ChessAI)[name].__func__
+        setattr(ChessAI, name + "_with_stats", staticmethod(function))
+        if lines is None:
+            continue  # without the source the functions as written serve both
+        # a method runs from its decorator line to the next line indented no deeper than the def
+        first = function.__code__.co_firstlineno - 1
+        indent = len(lines[first]) - len(lines[first].lstrip())
+        last = first
+        while lines[last].lstrip().startswith("@"):
+            last += 1
+        last += 1
+        while last < len(lines) and (not lines[last].strip() or len(lines[last]) - len(lines[last].lstrip()) > indent):
+            last += 1
+        # the empty lines in front keep the line numbers of the source, for tracebacks
+        source = "\n" * first + "\n".join(line[indent:] for line in lines[first:last])
+        for with_stats in (False, True):
+            variant = SearchVariant(with_stats).visit(ast.parse(source))
+            namespace = {}
+            exec(compile(variant, __file__, "exec"), globals(), namespace)
+            setattr(ChessAI, name + ("_with_stats" if with_stats else ""), staticmethod(namespace.popitem()[1]))
+    ChessAI.search_variants_built = True
+
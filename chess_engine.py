@@ -3,10 +3,60 @@ it is repsonsible for the chess engine logic and storing the current state
 of the game
 also determines the valid moves
 """
+import os
+import random
+import struct
+from array import array
+
+# pieces are stored in moves as small integer codes, 0 being an empty square
+PIECES = ("--", "wP", "wR", "wN", "wB", "wQ", "wK", "bP", "bR", "bN", "bB", "bQ", "bK")
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+PROMOTION_PIECES = (None, "Q", "R", "B", "N")
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1"  # the engine does not know castling
+
+# a move is packed into a single int, with the squares numbered row * 8 + col:
+#   bits 0-5 start square, bits 6-11 end square, bits 12-14 promotion piece,
+#   bit 15 en passant, bits 16-19 piece moved, bits 20-23 piece captured, bit 24 pawn promotion
+END_SHIFT = 6
+PROMOTION_SHIFT = 12
+EN_PASSANT_FLAG = 1 << 15
+MOVED_SHIFT = 16
+CAPTURED_SHIFT = 20
+PAWN_PROMOTION_FLAG = 1 << 24
+MOVE_ID_MASK = 0xFFF  # start and end squares
+MOVE_KEY_MASK = 0x7FFF  # start and end squares and the promotion piece
+MOVE_MASK = 0x1FFFFFF  # the whole packed move
+
+# every move made pushes a 64 bit undo record with what cannot be read back from the move itself:
+#   bits 0-24 the packed move, bits 25-28 the en-passant file before the move plus one (0 for none),
+#   bit 29 set when the move switched the turn, bits 30-45 the halfmove clock before the move
+# the king squares come back from the move, and the Zobrist key before the move is kept next to it
+UNDO_EN_PASSANT_SHIFT = 25
+UNDO_TURN_FLAG = 1 << 29
+UNDO_CLOCK_SHIFT = 30
+
+# snapshot of a position: the piece code of every square, white to move, the en-passant file plus one
+# (0 for none), the halfmove clock, the number of plies played and the Zobrist key, 80 bytes in all
+SNAPSHOT = struct.Struct("<64sBBHIQ")
+MAX_FULLMOVE_NUMBER = 1 << 30  # leaves the 32 bit ply of a snapshot room for the moves played after a FEN
+
+# random 64 bit numbers for Zobrist hashing: one per piece code and square, one for black to move
+# and one per en-passant file; the seed is fixed so the keys stay the same between runs
+_zobrist_random = random.Random(20240521)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in PIECES]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+PAWN_CODES = (PIECE_CODES["wP"], PIECE_CODES["bP"])  # the pieces in the pawn key
+
 
 class GameState:
     """Class to store the current state of the game"""
-    def __init__(self):
+
+    # directions from a square, orthogonal ones first: up, left, down, right, then the diagonals
+    king_directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+    knight_directions = ((-2, -1), (-1, -2), (1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1))
+
+    def __init__(self, eval_tables=None):
         # each list represents a row on the board
         # first character represents the color: w -> white, b -> black
         # second character represents the piece:
@@ -30,7 +80,9 @@ class GameState:
             "Q": self.get_queen_moves,
             "K": self.get_king_moves}
         self.white_to_move = True
-        self.move_log = []
+        self.move_log = None  # optional MoveLog of the moves made, undo_move does not need it
+        self.undo_stack = array("Q")  # undo records of the moves made, see UNDO_EN_PASSANT_SHIFT
+        self.key_stack = array("Q")  # Zobrist key before each move
 
         self.white_king_location = (7, 4) # row, col
         self.black_king_location = (0, 4) # row, col
@@ -39,78 +91,445 @@ class GameState:
         self.stale_mate = False
 
         self.en_passant_possible = ()
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+
+        # Zobrist key of the position, updated by make_move and restored by undo_move
+        self.zobrist_key = self.compute_zobrist_key()
+        # Zobrist key of the pawns only, for the pawn structure evaluation, updated by both
+        self.pawn_key = self.compute_pawn_key()
+
+        # running middlegame and endgame evaluation and game phase, updated by make_move and undo_move
+        # (the default tables are imported here because the evaluation module is built on this one)
+        if eval_tables is None:
+            from evaluation import DEFAULT_TABLES as eval_tables
+        self.eval_tables = eval_tables
+        self.mg_score, self.eg_score, self.phase = self.compute_evaluation()
+        self.piece_count = self.count_pieces()  # pieces on the board, kings and pawns included
+
+        # pins and checks against the current player's king, found by get_valid_moves
+        self.in_check_flag = False
+        self.pins = []
+        self.checks = []
+        self.captures_only = False  # set while get_capture_moves runs the move generators
+
+        # number of plies played before the position the game started from, for get_fen
+        self.start_ply = 0
 
     def make_move(self, move):
         """Make a move on the board"""
-        self.board[move.start_row][move.start_col] = "--"  # remove the piece from the old square
-        self.board[move.end_row][move.end_col] = move.piece_moved  # move the piece to the new square
-        self.move_log.append(move)  # log the move
-        
+        # read the packed move once instead of decoding it again for every use
+        start_row, start_col, end_row, end_col = move.start_row, move.start_col, move.end_row, move.end_col
+        piece_moved = move.piece_moved
+        is_pawn_promotion = move.is_pawn_promotion
+        promotion_choice = move.promotion_choice
+
+        value = move.value
+        self.key_stack.append(self.zobrist_key)
+        record = value | min(self.halfmove_clock, 0xFFFF) << UNDO_CLOCK_SHIFT
+        if self.en_passant_possible:
+            record |= (self.en_passant_possible[1] + 1) << UNDO_EN_PASSANT_SHIFT
+        # take the moved and the captured piece off their squares in the key
+        key = self.zobrist_key ^ ZOBRIST_PIECES[(move.value >> MOVED_SHIFT) & 15][start_row * 8 + start_col]
+        captured_code = (move.value >> CAPTURED_SHIFT) & 15
+        if captured_code:
+            captured_square = start_row * 8 + end_col if move.is_en_passant_move else end_row * 8 + end_col
+            key ^= ZOBRIST_PIECES[captured_code][captured_square]
+            self.piece_count -= 1
+            self.halfmove_clock = 0
+        elif piece_moved[1] == "P":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.en_passant_possible:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_possible[1]]
+
+        self.board[start_row][start_col] = "--"  # remove the piece from the old square
+        self.board[end_row][end_col] = piece_moved  # move the piece to the new square
+        if self.move_log is not None:
+            self.move_log.append(move)  # log the move
+
         # update the king's location if the piece moved is a king
-        if move.piece_moved == "bK":
-            self.black_king_location = (move.end_row, move.end_col)
-        elif move.piece_moved == "wK":
-            self.white_king_location = (move.end_row, move.end_col)
+        if piece_moved == "bK":
+            self.black_king_location = (end_row, end_col)
+        elif piece_moved == "wK":
+            self.white_king_location = (end_row, end_col)
 
         # check if the move is a pawn promotion
-        if move.is_pawn_promotion:
-            if move.promotion_choice:
-                self.board[move.end_row][move.end_col] = move.piece_moved[0] + move.promotion_choice
+        if is_pawn_promotion:
+            if promotion_choice:
+                self.board[end_row][end_col] = piece_moved[0] + promotion_choice
             else:
                 # Default to Queen if no choice provided (for simplicity)
-                self.board[move.end_row][move.end_col] = move.piece_moved[0] + "Q"
+                self.board[end_row][end_col] = piece_moved[0] + "Q"
 
         # en-passant move
         if move.is_en_passant_move:
-            if move.piece_moved[0] == "w":  # White pawn capturing black pawn
-                self.board[move.start_row][move.end_col] = "--"  # remove the captured black pawn
-            else:  # Black pawn capturing white pawn
-                self.board[move.start_row][move.end_col] = "--"  # remove the captured white pawn
+            self.board[start_row][end_col] = "--"  # remove the captured pawn
 
         # update en-passant possible variable
-        if move.piece_moved[1] == "P" and abs(move.start_row - move.end_row) == 2:  # pawn moved two squares
-            self.en_passant_possible = ((move.start_row + move.end_row) // 2, move.start_col)  # set the en-passant square
+        if piece_moved[1] == "P" and abs(start_row - end_row) == 2:  # pawn moved two squares
+            self.en_passant_possible = ((start_row + end_row) // 2, start_col)  # set the en-passant square
         else:
             self.en_passant_possible = ()
 
+        # put the piece that ended up on the end square and the new en-passant file into the key
+        end_code = PIECE_CODES[self.board[end_row][end_col]]
+        key ^= ZOBRIST_PIECES[end_code][end_row * 8 + end_col]
+        if self.en_passant_possible:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_possible[1]]
+
         # After making the move, switch turns only if this wasn't a promotion without a choice
-        if not (move.is_pawn_promotion and not move.promotion_choice):
+        if not (is_pawn_promotion and not promotion_choice):
             self.white_to_move = not self.white_to_move  # switch turns
+            key ^= ZOBRIST_BLACK_TO_MOVE
+            record |= UNDO_TURN_FLAG
+        self.zobrist_key = key
+        self.undo_stack.append(record)
+
+        mg_change, eg_change, phase_change = self.evaluation_change(value, end_code)
+        self.mg_score += mg_change
+        self.eg_score += eg_change
+        self.phase += phase_change
+        if (value >> MOVED_SHIFT & 15) in PAWN_CODES or captured_code in PAWN_CODES:
+            self.pawn_key ^= self.pawn_key_change(value, end_code)
 
     def undo_move(self):
         """Undo the last move made"""
-        if len(self.move_log) != 0: # check if there are any moves to undo
-            move = self.move_log.pop()
-            self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
-
-            # undo the king's location 
-            if move.piece_moved == "bK":
-                self.black_king_location = (move.start_row, move.start_col)
-            elif move.piece_moved == "wK":
-                self.white_king_location = (move.start_row, move.start_col)
-
-            # undo en passant 
-            if move.is_en_passant_move:
-                self.board[move.end_row][move.end_col] = "--" # leaving landing square blank
-                if move.piece_moved[0] == "w":  # White was capturing black pawn
-                    self.board[move.start_row][move.end_col] = "bP" # restore the captured black pawn
-                else:  # Black was capturing white pawn
-                    self.board[move.start_row][move.end_col] = "wP" # restore the captured white pawn
-                self.en_passant_possible = (move.end_row, move.end_col)
-
-            # undo two square pawn advance
-            if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:
+        if len(self.undo_stack) != 0: # check if there are any moves to undo
+            # everything comes back from the undo record and the key stack, the move log is only kept in step
+            record = self.undo_stack.pop()
+            if self.move_log:
+                self.move_log.pop()
+            # the move is read straight from the record, without making a Move of it
+            board = self.board
+            start_row, start_col = record >> 3 & 7, record & 7
+            end_row, end_col = record >> END_SHIFT + 3 & 7, record >> END_SHIFT & 7
+            piece_moved = PIECES[record >> MOVED_SHIFT & 15]
+            captured_code = record >> CAPTURED_SHIFT & 15
+
+            end_code = PIECE_CODES[board[end_row][end_col]]
+            mg_change, eg_change, phase_change = self.evaluation_change(record & MOVE_MASK, end_code)
+            self.mg_score -= mg_change
+            self.eg_score -= eg_change
+            self.phase -= phase_change
+            if (record >> MOVED_SHIFT & 15) in PAWN_CODES or captured_code in PAWN_CODES:
+                self.pawn_key ^= self.pawn_key_change(record & MOVE_MASK, end_code)
+
+            board[start_row][start_col] = piece_moved
+            if captured_code:
+                self.piece_count += 1
+                if record & EN_PASSANT_FLAG:
+                    board[end_row][end_col] = "--"  # leaving landing square blank
+                    board[start_row][end_col] = PIECES[captured_code]  # restore the captured pawn
+                else:
+                    board[end_row][end_col] = PIECES[captured_code]
+            else:
+                board[end_row][end_col] = "--"
+
+            # undo the king's location
+            if piece_moved == "bK":
+                self.black_king_location = (start_row, start_col)
+            elif piece_moved == "wK":
+                self.white_king_location = (start_row, start_col)
+
+            # restore the en-passant square, the halfmove clock and the key from before the move
+            en_passant_file = record >> UNDO_EN_PASSANT_SHIFT & 15
+            if en_passant_file:
+                # the pawn that could be taken en passant was pushed by the side that moved before this move
+                self.en_passant_possible = (2 if piece_moved[0] == "w" else 5,
+                                            en_passant_file - 1)
+            else:
                 self.en_passant_possible = ()
-            
-            self.white_to_move = not self.white_to_move
+            self.halfmove_clock = record >> UNDO_CLOCK_SHIFT & 0xFFFF
+            self.zobrist_key = self.key_stack.pop()
+
+            if record & UNDO_TURN_FLAG:
+                self.white_to_move = not self.white_to_move
 
             self.check_mate = False
             self.stale_mate = False
 
-    def get_all_possible_moves(self):
-        """Get all possible moves for the current player"""
-        moves = []
+    def last_move(self):
+        """Get the last move made, None at the start of the game"""
+        return packed_move(self.undo_stack[-1] & MOVE_MASK) if self.undo_stack else None
+
+    @classmethod
+    def from_fen(cls, fen, eval_tables=None):
+        """Create a game state set up from a FEN"""
+        gs = cls(eval_tables)
+        gs.load_fen(fen)
+        return gs
+
+    def load_fen(self, fen):
+        """Set up the position of a FEN, raising ValueError if it cannot be read"""
+        # castling rights are accepted but dropped, as the engine does not know castling
+        fields = fen.split()
+        if len(fields) < 2 or len(fields) > 6:
+            raise ValueError(f"a FEN has 2 to 6 fields: {fen!r}")
+        fen_rows = fields[0].split("/")
+        if len(fen_rows) != 8:
+            raise ValueError(f"a FEN has 8 rows: {fen!r}")
+        board = []
+        for fen_row in fen_rows:
+            row = []
+            for char in fen_row:
+                if char in "12345678":
+                    row.extend(["--"] * int(char))
+                elif char.upper() in "PRNBQK":
+                    row.append(("w" if char.isupper() else "b") + char.upper())
+                else:
+                    raise ValueError(f"unknown piece {char!r} in FEN: {fen!r}")
+            if len(row) != 8:
+                raise ValueError(f"a FEN row has 8 squares: {fen!r}")
+            board.append(row)
+        kings = {piece: (row, col) for row in range(8) for col in range(8)
+                 if (piece := board[row][col]) in ("wK", "bK")}
+        if len(kings) != 2 or sum(row.count("wK") + row.count("bK") for row in board) != 2:
+            raise ValueError(f"a FEN needs one king of each color: {fen!r}")
+        if fields[1] not in ("w", "b"):
+            raise ValueError(f"the side to move is w or b: {fen!r}")
+        en_passant = fields[3] if len(fields) > 3 else "-"
+        if en_passant != "-" and (len(en_passant) != 2 or en_passant[0] not in Move.files_to_cols or
+                                  en_passant[1] not in ("3", "6")):
+            raise ValueError(f"bad en-passant square in FEN: {fen!r}")
+        white_to_move = fields[1] == "w"
+        if en_passant != "-":
+            # the square is only kept when a pawn of the side not to move can just have passed it:
+            # the pawn stands in front of it and the square and the one behind it are empty
+            row, col = Move.ranks_to_rows[en_passant[1]], Move.files_to_cols[en_passant[0]]
+            pawn_row, start_row = (row + 1, row - 1) if white_to_move else (row - 1, row + 1)
+            if row != (2 if white_to_move else 5) or board[pawn_row][col] != ("b" if white_to_move else "w") + "P" \
+                    or board[row][col] != "--" or board[start_row][col] != "--":
+                en_passant = "-"  # no en passant capture is possible, as other engines read it
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"bad move counters in FEN: {fen!r}") from None
+        # the undo records and snapshots hold the counters unsigned, the ply in 32 bits
+        if halfmove_clock < 0 or not 1 <= fullmove_number <= MAX_FULLMOVE_NUMBER:
+            raise ValueError(f"bad move counters in FEN: {fen!r}")
+
+        # the side that just moved cannot have left its king in check, the search could capture it
+        previous = self.board, self.white_to_move
+        self.board, self.white_to_move = board, not white_to_move
+        try:
+            king_row, king_col = kings["bK" if white_to_move else "wK"]
+            if self.square_under_attack(king_row, king_col):
+                raise ValueError(f"the side not to move is in check in FEN: {fen!r}")
+        finally:
+            self.board, self.white_to_move = previous
+
+        self.board = board
+        self.white_king_location = kings["wK"]
+        self.black_king_location = kings["bK"]
+        self.white_to_move = white_to_move
+        self.en_passant_possible = () if en_passant == "-" else \
+            (Move.ranks_to_rows[en_passant[1]], Move.files_to_cols[en_passant[0]])
+        self.halfmove_clock = halfmove_clock
+        self.start_ply = 2 * (fullmove_number - 1) + (0 if self.white_to_move else 1)
+        self.clear_history()
+
+        # everything derived from the board has to be rebuilt
+        self.zobrist_key = self.compute_zobrist_key()
+        self.pawn_key = self.compute_pawn_key()
+        self.mg_score, self.eg_score, self.phase = self.compute_evaluation()
+        self.piece_count = self.count_pieces()
+
+    def clear_history(self):
+        """Forget the moves made and the flags found for the previous position, after setting up a new one"""
+        if self.move_log is not None:
+            self.move_log.clear()
+        self.undo_stack = array("Q")
+        self.key_stack = array("Q")
+        self.check_mate = False
+        self.stale_mate = False
+        self.in_check_flag = False
+        self.pins = []
+        self.checks = []
+
+    def snapshot(self):
+        """Get the position as 80 bytes, see SNAPSHOT; the moves that led to it are not part of it"""
+        return SNAPSHOT.pack(bytes([PIECE_CODES[piece] for row in self.board for piece in row]),
+                             self.white_to_move, self.en_passant_possible[1] + 1 if self.en_passant_possible else 0,
+                             min(self.halfmove_clock, 0xFFFF), self.start_ply + len(self.undo_stack), self.zobrist_key)
+
+    @classmethod
+    def from_snapshot(cls, data, eval_tables=None):
+        """Create a game state from a snapshot"""
+        gs = cls(eval_tables)
+        gs.load_snapshot(data)
+        return gs
+
+    def load_snapshot(self, data):
+        """Set up the position of a snapshot"""
+        codes, white_to_move, en_passant_file, halfmove_clock, ply, key = SNAPSHOT.unpack(data)
+        self.board = [[PIECES[code] for code in codes[row:row + 8]] for row in range(0, 64, 8)]
+        self.white_king_location = divmod(codes.index(PIECE_CODES["wK"]), 8)
+        self.black_king_location = divmod(codes.index(PIECE_CODES["bK"]), 8)
+        self.white_to_move = bool(white_to_move)
+        # the pawn that can be taken en passant was pushed by the other side
+        self.en_passant_possible = ((2 if white_to_move else 5), en_passant_file - 1) if en_passant_file else ()
+        self.halfmove_clock = halfmove_clock
+        self.start_ply = ply
+        self.clear_history()
+        self.zobrist_key = key
+        self.pawn_key = self.compute_pawn_key()
+        self.mg_score, self.eg_score, self.phase = self.compute_evaluation()
+        self.piece_count = 64 - codes.count(0)
+
+    def clone(self):
+        """Get a copy of the game state to make moves on, sharing only what never changes"""
+        gs = object.__new__(type(self))
+        gs.__dict__.update(self.__dict__)
+        gs.board = [row[:] for row in self.board]
+        gs.move_functions = {
+            "P": gs.get_pawn_moves,
+            "R": gs.get_rook_moves,
+            "N": gs.get_knight_moves,
+            "B": gs.get_bishop_moves,
+            "Q": gs.get_queen_moves,
+            "K": gs.get_king_moves}
+        gs.move_log = self.move_log.copy() if self.move_log is not None else None
+        gs.undo_stack = array("Q", self.undo_stack)
+        gs.key_stack = array("Q", self.key_stack)
+        gs.pins = list(self.pins)
+        gs.checks = list(self.checks)
+        return gs
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+    def __reduce__(self):
+        # pickled as a snapshot, so a game state sent to another process costs 80 bytes and not the whole
+        # object; the moves made are left behind, and the evaluation tables are only sent when not the default
+        from evaluation import DEFAULT_TABLES
+        return restore_snapshot, (type(self), self.snapshot(),
+                                  None if self.eval_tables is DEFAULT_TABLES else self.eval_tables)
+
+    def get_fen(self):
+        """Write the current position as a FEN"""
+        fen_rows = []
+        for row in self.board:
+            fen_row = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                fen_row += piece[1] if piece[0] == "w" else piece[1].lower()
+            fen_rows.append(fen_row + (str(empty) if empty else ""))
+        en_passant = "-"
+        if self.en_passant_possible:
+            row, col = self.en_passant_possible
+            en_passant = Move.cols_to_files[col] + Move.rows_to_ranks[row]
+
+        fullmove_number = (self.start_ply + len(self.undo_stack)) // 2 + 1
+        return f"{'/'.join(fen_rows)} {'w' if self.white_to_move else 'b'} - {en_passant} " \
+               f"{self.halfmove_clock} {fullmove_number}"
+
+    def compute_zobrist_key(self):
+        """Compute the Zobrist key of the position from scratch"""
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[PIECE_CODES[piece]][row * 8 + col]
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant_possible:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_possible[1]]
+        return key
+
+    def compute_pawn_key(self):
+        """Compute the Zobrist key of the pawns from scratch, 0 without pawns"""
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                code = PIECE_CODES[self.board[row][col]]
+                if code in PAWN_CODES:
+                    key ^= ZOBRIST_PIECES[code][row * 8 + col]
+        return key
+
+    def pawn_key_change(self, value, end_code):
+        """Get how a move, given by its packed value, changes the pawn key; making it again undoes the change"""
+        start_square = value & 63
+        end_square = (value >> END_SHIFT) & 63
+        moved_code = (value >> MOVED_SHIFT) & 15
+        captured_code = (value >> CAPTURED_SHIFT) & 15
+        change = 0
+        if moved_code in PAWN_CODES:
+            change ^= ZOBRIST_PIECES[moved_code][start_square]
+        if end_code in PAWN_CODES:  # not for promotions
+            change ^= ZOBRIST_PIECES[end_code][end_square]
+        if captured_code in PAWN_CODES:
+            captured_square = (start_square & 56) | (end_square & 7) if value & EN_PASSANT_FLAG else end_square
+            change ^= ZOBRIST_PIECES[captured_code][captured_square]
+        return change
+
+    def get_pawns(self):
+        """Get the squares of the white and of the black pawns, as 64 bit masks of row * 8 + col"""
+        white_pawns = black_pawns = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece == "wP":
+                    white_pawns |= 1 << (row * 8 + col)
+                elif piece == "bP":
+                    black_pawns |= 1 << (row * 8 + col)
+        return white_pawns, black_pawns
+
+    def compute_evaluation(self):
+        """Compute the middlegame score, endgame score and phase of the position from scratch"""
+        tables = self.eval_tables
+        mg_score = eg_score = phase = 0
+        for row in range(8):
+            for col in range(8):
+                code = PIECE_CODES[self.board[row][col]]
+                mg_score += tables.mg[code][row * 8 + col]
+                eg_score += tables.eg[code][row * 8 + col]
+                phase += tables.phase[code]
+        return mg_score, eg_score, phase
+
+    def count_pieces(self):
+        """Count the pieces on the board from scratch"""
+        return sum(piece != "--" for row in self.board for piece in row)
+
+    def evaluation_change(self, value, end_code):
+        """Get how a move, given by its packed value, changes the middlegame score, endgame score and phase"""
+        # end_code is the piece standing on the end square after the move, which differs from the
+        # piece moved for promotions
+        tables = self.eval_tables
+        start_square = value & 63
+        end_square = (value >> END_SHIFT) & 63
+        moved_code = (value >> MOVED_SHIFT) & 15
+        captured_code = (value >> CAPTURED_SHIFT) & 15
+
+        mg_change = tables.mg[end_code][end_square] - tables.mg[moved_code][start_square]
+        eg_change = tables.eg[end_code][end_square] - tables.eg[moved_code][start_square]
+        phase_change = tables.phase[end_code] - tables.phase[moved_code]
+        if captured_code:
+            # the pawn taken en passant stands next to the start square, on the end square's column
+            captured_square = (start_square & 56) | (end_square & 7) if value & EN_PASSANT_FLAG else end_square
+            mg_change -= tables.mg[captured_code][captured_square]
+            eg_change -= tables.eg[captured_code][captured_square]
+            phase_change -= tables.phase[captured_code]
+        return mg_change, eg_change, phase_change
+
+    def get_evaluation(self):
+        """Get the evaluation of the position in centipawns, positive when white is better"""
+        return self.eval_tables.blend(self.mg_score, self.eg_score, self.phase)
+
+    def get_all_possible_moves(self, moves=None):
+        """Get all possible moves for the current player, filling the given move list if there is one"""
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()  # reuse the list instead of allocating a new one
         for row in range(len(self.board)): # rows of the board
             for col in range(len(self.board[row])): #  columns of the board
                 turn = self.board[row][col][0] # get the color of the piece
@@ -122,28 +541,52 @@ class GameState:
 
         return moves
 
-    def get_valid_moves(self):
-        """Get all valid moves for the current player"""
+    def get_indexed_moves(self):
+        """Get all valid moves for the current player as a MoveSet, for looking them up by square"""
+        return MoveSet(self.get_valid_moves())
+
+    def get_capture_moves(self, moves=None):
+        """Get the valid captures and promotions for the current player, used by the quiescence search"""
+        # the checkmate and stalemate flags are left alone, as no captures says nothing about them
+        return self.get_valid_moves(moves, captures_only=True)
 
-        temp_en_passant_possible = self.en_passant_possible # store the current en-passant variable
-        # first get all possible moves
-        moves = self.get_all_possible_moves()
-        # for each move, make the move
-        for i in range(len(moves) - 1, -1, -1):
-            self.make_move(moves[i])
-            # when make_move is called, the turn is switched, so we need to change it back to the current player before checking for check
-            self.white_to_move = not self.white_to_move
+    def get_valid_moves(self, moves=None, captures_only=False):
+        """Get all valid moves for the current player, filling the given move list if there is one"""
+        self.captures_only = captures_only
+        # find the pinned pieces and the checking pieces once for the whole position,
+        # so the move generators only ever produce legal moves
+        self.in_check_flag, self.pins, self.checks = self.check_for_pins_and_checks()
 
-            # generate all possible moves for the opponent and for each move, check if the king is in check
-            if self.in_check():
-                moves.remove(moves[i])
+        if self.white_to_move:
+            king_row, king_col = self.white_king_location
+        else:
+            king_row, king_col = self.black_king_location
+
+        if self.in_check_flag:
+            if len(self.checks) == 1:  # only one check: block the check, capture the checker or move the king
+                moves = self.get_all_possible_moves(moves)
+                valid_squares = self.get_check_evasion_squares(king_row, king_col)
+
+                # get rid of the moves that don't block the check, capture the checker or move the king
+                for i in range(len(moves) - 1, -1, -1):
+                    if not self.is_check_evasion(moves[i], valid_squares):
+                        del moves[i]
+            else:  # double check, so the king has to move
+                if moves is None:
+                    moves = []
+                else:
+                    moves.clear()
+                self.get_king_moves(king_row, king_col, moves)
+        else:  # not in check, so all the moves are fine apart from the ones handled by pins
+            moves = self.get_all_possible_moves(moves)
 
-            self.white_to_move = not self.white_to_move # switch back to the current player's turn
-            self.undo_move() # undo the move made to check for check
+        if captures_only:
+            self.captures_only = False
+            return moves
 
         # if there are no valid moves, check for checkmate or stalemate
         if len(moves) == 0:
-            if self.in_check():
+            if self.in_check_flag:
                 self.check_mate = True
             else:
                 self.stale_mate = True
@@ -151,9 +594,227 @@ class GameState:
             self.check_mate = False
             self.stale_mate = False
 
-        self.en_passant_possible = temp_en_passant_possible # reset the en-passant variable
         return moves # return the valid moves
 
+    def get_check_evasion_squares(self, king_row, king_col):
+        """Get the squares that pieces other than the king can move to against the single check"""
+        check_row, check_col, check_dir_row, check_dir_col = self.checks[0]
+        piece_checking = self.board[check_row][check_col]
+
+        valid_squares = []
+        if piece_checking[1] == "N":  # a knight check cannot be blocked, it must be captured
+            valid_squares.append((check_row, check_col))
+        else:
+            for i in range(1, 8):
+                valid_square = (king_row + check_dir_row * i, king_col + check_dir_col * i)
+                valid_squares.append(valid_square)
+                if valid_square == (check_row, check_col):  # reached the checking piece
+                    break
+        return valid_squares
+
+    def is_check_evasion(self, move, valid_squares):
+        """Check if a move blocks the single check, captures the checker or moves the king"""
+        if move.piece_moved[1] == "K":
+            return True  # king moves were already checked for safety
+        if (move.end_row, move.end_col) in valid_squares:
+            return True
+        # en-passant capture of the pawn that gives check
+        check_row, check_col = self.checks[0][:2]
+        return move.is_en_passant_move and (move.start_row, move.end_col) == (check_row, check_col)
+
+    def has_legal_move(self):
+        """Check if the current player has a valid move, stopping at the first one found"""
+        # sets the checkmate and stalemate flags like get_valid_moves, without building the whole move list
+        self.captures_only = False
+        self.in_check_flag, self.pins, self.checks = self.check_for_pins_and_checks()
+        if self.white_to_move:
+            king_row, king_col = self.white_king_location
+        else:
+            king_row, king_col = self.black_king_location
+
+        moves = []
+        self.get_king_moves(king_row, king_col, moves)  # king moves are legal whatever the checks
+        found = len(moves) > 0
+        if not found and len(self.checks) < 2:  # in double check only the king can move
+            valid_squares = self.get_check_evasion_squares(king_row, king_col) if self.in_check_flag else None
+            ally_color = "w" if self.white_to_move else "b"
+            for row in range(8):
+                for col in range(8):
+                    piece = self.board[row][col]
+                    if piece[0] != ally_color or piece[1] == "K":
+                        continue
+                    self.move_functions[piece[1]](row, col, moves)
+                    if valid_squares is None:
+                        found = len(moves) > 0
+                    else:
+                        found = any(self.is_check_evasion(move, valid_squares) for move in moves)
+                    if found:
+                        break
+                    moves.clear()
+                if found:
+                    break
+
+        self.check_mate = not found and self.in_check_flag
+        self.stale_mate = not found and not self.in_check_flag
+        return found
+
+    def find_legal_move(self, move_key):
+        """Get the valid move with the squares and promotion piece of the key, None if there is none"""
+        # only the moves of the piece on the start square are generated; the pins and checks have to
+        # have been found for the position, and it must not be in check
+        row, col = divmod(move_key & 63, 8)
+        piece = self.board[row][col]
+        if piece[0] != ("w" if self.white_to_move else "b"):
+            return None
+        moves = []
+        self.move_functions[piece[1]](row, col, moves)
+        for move in moves:
+            if move.value & MOVE_KEY_MASK == move_key:
+                return move
+        return None
+
+    def get_staged_moves(self, first_moves=(), killers=(), order=None):
+        """Yield the valid moves a stage at a time, generating each stage only once the earlier ones are used up"""
+        # stages: the first moves given (such as the hash move), captures and promotions, the killer
+        # moves and then the remaining quiet moves, captures and quiet moves each sorted by the order key
+        # the pins and checks are only looked for when a first or killer move has to be checked, and as
+        # moves made on the board while the generator is paused overwrite them, they are kept here
+        # and put back before every check
+        if self.in_check():  # the evasions are few, so they are all generated at once
+            first_keys = {key & MOVE_KEY_MASK for key in first_moves if key}
+            moves = self.get_valid_moves()
+            moves.sort(key=lambda move: (move.value & MOVE_KEY_MASK in first_keys, order(move) if order else 0),
+                       reverse=True)
+            yield from moves
+            return
+
+        pins_and_checks = None
+        searched = set()
+        for key in first_moves:
+            if key and key & MOVE_KEY_MASK not in searched:
+                if pins_and_checks is None:
+                    pins_and_checks = self.check_for_pins_and_checks()
+                self.in_check_flag, self.pins, self.checks = pins_and_checks
+                self.captures_only = False
+                move = self.find_legal_move(key & MOVE_KEY_MASK)
+                if move is not None:
+                    searched.add(key & MOVE_KEY_MASK)
+                    yield move
+
+        captures = self.get_valid_moves(captures_only=True)
+        if order is not None:
+            captures.sort(key=order, reverse=True)
+        for move in captures:
+            if move.value & MOVE_KEY_MASK not in searched:
+                searched.add(move.value & MOVE_KEY_MASK)
+                yield move
+
+        for key in killers:
+            if key and key not in searched:
+                if pins_and_checks is None:
+                    pins_and_checks = self.check_for_pins_and_checks()
+                self.in_check_flag, self.pins, self.checks = pins_and_checks
+                self.captures_only = False
+                move = self.find_legal_move(key)
+                if move is not None and not move.value >> CAPTURED_SHIFT & 15:
+                    searched.add(key)
+                    yield move
+
+        moves = self.get_valid_moves()
+        if order is not None:
+            moves.sort(key=order, reverse=True)
+        for move in moves:
+            if move.value & MOVE_KEY_MASK not in searched:
+                yield move
+
+    def check_for_pins_and_checks(self):
+        """Find the pins on and the checks against the current player's king"""
+        pins = []  # squares of allied pinned pieces and the direction of the pin: (row, col, dir_row, dir_col)
+        checks = []  # squares of enemy checking pieces and the direction of the check: (row, col, dir_row, dir_col)
+        in_check = False
+
+        if self.white_to_move:
+            enemy_color, ally_color = "b", "w"
+            start_row, start_col = self.white_king_location
+        else:
+            enemy_color, ally_color = "w", "b"
+            start_row, start_col = self.black_king_location
+
+        # look outward from the king along the orthogonal and diagonal rays
+        for j in range(len(self.king_directions)):
+            dir_row, dir_col = self.king_directions[j]
+            possible_pin = ()  # reset possible pins for every direction
+            for i in range(1, 8):
+                end_row = start_row + dir_row * i
+                end_col = start_col + dir_col * i
+                if not (0 <= end_row < 8 and 0 <= end_col < 8):
+                    break  # off the board
+
+                end_piece = self.board[end_row][end_col]
+                if end_piece[0] == ally_color:
+                    if possible_pin == ():  # first allied piece could be pinned
+                        possible_pin = (end_row, end_col, dir_row, dir_col)
+                    else:  # second allied piece, so no pin or check possible in this direction
+                        break
+                elif end_piece[0] == enemy_color:
+                    piece_type = end_piece[1]
+                    # the enemy piece attacks along this ray if:
+                    # 1. it is orthogonally away from the king and it is a rook
+                    # 2. it is diagonally away from the king and it is a bishop
+                    # 3. it is one square away diagonally towards the enemy side and it is a pawn
+                    # 4. it is in any direction and it is a queen
+                    # 5. it is in any direction one square away and it is a king
+                    if (j <= 3 and piece_type == "R") or \
+                            (j >= 4 and piece_type == "B") or \
+                            (i == 1 and piece_type == "P" and
+                             ((enemy_color == "w" and j >= 6) or (enemy_color == "b" and 4 <= j <= 5))) or \
+                            (piece_type == "Q") or \
+                            (i == 1 and piece_type == "K"):
+                        if possible_pin == ():  # no piece blocking, so it is a check
+                            in_check = True
+                            checks.append((end_row, end_col, dir_row, dir_col))
+                        else:  # allied piece blocking, so it is a pin
+                            pins.append(possible_pin)
+                    break  # the ray is blocked by the enemy piece either way
+                # empty square, keep looking along the ray
+
+        # knights can only check, never pin
+        for dir_row, dir_col in self.knight_directions:
+            end_row = start_row + dir_row
+            end_col = start_col + dir_col
+            if 0 <= end_row < 8 and 0 <= end_col < 8:
+                end_piece = self.board[end_row][end_col]
+                if end_piece[0] == enemy_color and end_piece[1] == "N":
+                    in_check = True
+                    checks.append((end_row, end_col, dir_row, dir_col))
+
+        return in_check, pins, checks
+
+    def get_pin_direction(self, row, col):
+        """Get the direction of the pin on the piece at the square, or () if it is not pinned"""
+        for pin in self.pins:
+            if pin[0] == row and pin[1] == col:
+                return (pin[2], pin[3])
+        return ()
+
+    def en_passant_is_legal(self, row, col, end_col):
+        """Check that an en-passant capture does not expose the king to a discovered check"""
+        # both pawns leave the rank at once, which the pin detection cannot see,
+        # so the capture is played on the board and the king is checked directly
+        captured_piece = self.board[row][end_col]
+        end_row = row - 1 if self.white_to_move else row + 1
+        piece = self.board[row][col]
+        self.board[row][col] = "--"
+        self.board[row][end_col] = "--"
+        self.board[end_row][end_col] = piece
+
+        in_check = self.in_check()
+
+        self.board[end_row][end_col] = "--"
+        self.board[row][end_col] = captured_piece
+        self.board[row][col] = piece
+        return not in_check
+
     def in_check(self):
         """Check if the current player is in check"""
         if self.white_to_move:
@@ -164,124 +825,168 @@ class GameState:
 
     def square_under_attack(self, row, col):
         """Check if a square is under attack by enemy"""
-        self.white_to_move = not self.white_to_move # switch to opponent's turn
-        enemy_moves = self.get_all_possible_moves() # get all possible moves for the opponent
-        self.white_to_move = not self.white_to_move # switch back to current player's turn
+        # look outward from the square for enemy pieces that could reach it,
+        # and stop as soon as the first attacker is found
+        board = self.board
+        enemy_color = "b" if self.white_to_move else "w"
 
-        for move in enemy_moves:
-            if move.end_row == row and move.end_col == col: # check if the move ends on the square
-                return True # square is under attack
+        # knights
+        enemy_knight = enemy_color + "N"
+        for dir_row, dir_col in self.knight_directions:
+            end_row = row + dir_row
+            end_col = col + dir_col
+            if 0 <= end_row < 8 and 0 <= end_col < 8 and board[end_row][end_col] == enemy_knight:
+                return True
+
+        # pawns attack diagonally from one row towards the enemy side
+        pawn_row = row - 1 if enemy_color == "b" else row + 1
+        if 0 <= pawn_row < 8:
+            enemy_pawn = enemy_color + "P"
+            if col > 0 and board[pawn_row][col - 1] == enemy_pawn:
+                return True
+            if col < 7 and board[pawn_row][col + 1] == enemy_pawn:
+                return True
+
+        # sliding pieces and the enemy king, orthogonal rays first and then the diagonals
+        for j in range(len(self.king_directions)):
+            dir_row, dir_col = self.king_directions[j]
+            slider = "R" if j <= 3 else "B"
+            for i in range(1, 8):
+                end_row = row + dir_row * i
+                end_col = col + dir_col * i
+                if not (0 <= end_row < 8 and 0 <= end_col < 8):
+                    break  # off the board
+
+                end_piece = board[end_row][end_col]
+                if end_piece == "--":
+                    continue
+                if end_piece[0] == enemy_color:
+                    piece_type = end_piece[1]
+                    if piece_type == slider or piece_type == "Q" or (i == 1 and piece_type == "K"):
+                        return True
+                break  # the ray is blocked
 
         return False # square is not under attack
 
 
     """
     the following methods are used to get the moves for each piece type
+    they only generate moves that keep the king safe from the pins found in get_valid_moves
     """
 
     def get_pawn_moves(self, row, col, moves):
         """Get all possible moves for a pawn"""
+        pin_direction = self.get_pin_direction(row, col)
 
-        # white pawn moves
         if self.white_to_move:
-            if row > 0 and self.board[row - 1][col] == "--": # 1 square pawn advance
-                moves.append(Move((row, col), (row - 1, col), self.board))
-                if row == 6 and self.board[row - 2][col] == '--': # 2 square pawn advance
-                    moves.append(Move((row, col), (row - 2, col), self.board))
-
-            # capture diagonally
-            if col - 1 >= 0 and row > 0: # capture left
-                if self.board[row - 1][col - 1][0] == "b": # capture left
-                    moves.append(Move((row, col), (row - 1, col - 1), self.board))
-                elif (row - 1, col - 1) == self.en_passant_possible:
-                    moves.append(Move((row, col), (row - 1, col - 1), self.board, is_en_passant_move=True)) # en passant left
-
-            if col + 1 <= 7 and row > 0: # capture right
-                if self.board[row - 1][col + 1][0] == "b": # capture right
-                    moves.append(Move((row, col), (row - 1, col + 1), self.board))
-                elif (row - 1, col + 1) == self.en_passant_possible:
-                    moves.append(Move((row, col), (row - 1, col + 1), self.board, is_en_passant_move=True)) # en passant right
-
-        # black pawn moves
+            move_amount, start_row, enemy_color = -1, 6, "b"
         else:
-            if row < 7 and self.board[row + 1][col] == "--":
-                moves.append(Move((row, col), (row + 1, col), self.board))
-                if row == 1 and self.board[row + 2][col] == '--':
-                    moves.append(Move((row, col), (row + 2, col), self.board))
-
-            # capture diagonally
-            if col - 1 >= 0 and row < 7: # capture left
-                if self.board[row + 1][col - 1][0] == "w": # capture left
-                    moves.append(Move((row, col), (row + 1, col - 1), self.board))
-                elif (row + 1, col - 1) == self.en_passant_possible:
-                    moves.append(Move((row, col), (row + 1, col - 1), self.board, is_en_passant_move=True)) # en passant left
-
-            if col + 1 <= 7 and row < 7: # capture right
-                if self.board[row + 1][col + 1][0] == "w": # capture right
-                    moves.append(Move((row, col), (row + 1, col + 1), self.board))
-                elif (row + 1, col + 1) == self.en_passant_possible:
-                    moves.append(Move((row, col), (row + 1, col + 1), self.board, is_en_passant_move=True)) # en passant right
-
+            move_amount, start_row, enemy_color = 1, 1, "w"
+
+        end_row = row + move_amount
+        if not 0 <= end_row < 8:
+            return
+
+        board = self.board
+        move_base = (row * 8 + col) | PIECE_CODES[board[row][col]] << MOVED_SHIFT
+        promotion = end_row == 0 or end_row == 7
+
+        # a pinned pawn can only move along the pin
+        if board[end_row][col] == "--" and (promotion or not self.captures_only):  # 1 square pawn advance
+            if pin_direction == () or pin_direction == (move_amount, 0) or pin_direction == (-move_amount, 0):
+                self.add_pawn_move(move_base | (end_row * 8 + col) << END_SHIFT, promotion, moves)
+                if row == start_row and board[end_row + move_amount][col] == "--":  # 2 square pawn advance
+                    moves.append(packed_move(move_base | ((end_row + move_amount) * 8 + col) << END_SHIFT))
+
+        # capture diagonally
+        for col_amount in (-1, 1):  # capture left, capture right
+            end_col = col + col_amount
+            if not 0 <= end_col < 8:
+                continue
+            if pin_direction == () or pin_direction == (move_amount, col_amount) or \
+                    pin_direction == (-move_amount, -col_amount):
+                end_piece = board[end_row][end_col]
+                if end_piece[0] == enemy_color:
+                    self.add_pawn_move(move_base | (end_row * 8 + end_col) << END_SHIFT |
+                                       PIECE_CODES[end_piece] << CAPTURED_SHIFT, promotion, moves)
+                elif (end_row, end_col) == self.en_passant_possible and self.en_passant_is_legal(row, col, end_col):
+                    moves.append(packed_move(move_base | (end_row * 8 + end_col) << END_SHIFT |
+                                             PIECE_CODES[enemy_color + "P"] << CAPTURED_SHIFT | EN_PASSANT_FLAG))
+
+    @staticmethod
+    def add_pawn_move(value, promotion, moves):
+        """Add a packed pawn move, or one move for every promotion piece if the pawn promotes"""
+        if promotion:
+            for code in range(1, len(PROMOTION_PIECES)):
+                moves.append(packed_move(value | code << PROMOTION_SHIFT | PAWN_PROMOTION_FLAG))
+        else:
+            moves.append(packed_move(value))
 
     def get_rook_moves(self, row, col, moves):
         """Get all possible moves for a rook"""
         directions = [(-1, 0), (1, 0), (0, 1), (0, -1)] # up, down, right, left
-        enemy_color = "b" if self.white_to_move else "w"
-
-        for dir in directions:
-            for i in range(1, 8): # can move at max 7 squares in 4 basic directions
-                # calculate the new row and column
-                new_row = row + dir[0] * i
-                new_col = col + dir[1] * i
-                if 0 <= new_row < 8 and 0 <= new_col < 8: # check if the new square is on the board
-
-                    end_piece = self.board[new_row][new_col]
-                    if end_piece == "--":
-                        moves.append(Move((row, col), (new_row, new_col), self.board))
-
-                    elif end_piece[0] == enemy_color: # capture the piece
-                        moves.append(Move((row, col), (new_row, new_col), self.board))
-                        break # stop moving in this direction
-
-                    else: # friendly piece
-                        break # stop moving in this direction
-                else:
-                    break
+        self.get_sliding_moves(row, col, directions, moves)
 
     def get_knight_moves(self, row, col, moves):
         """Get all possible moves for a knight"""
-        knight_moves = [(-2, -1), (-1, -2), (1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1)]  # all possible knight moves
+        if self.get_pin_direction(row, col) != ():
+            return  # a pinned knight can never move along the pin
         ally_color = "w" if self.white_to_move else "b"
+        board = self.board
+        move_base = (row * 8 + col) | PIECE_CODES[board[row][col]] << MOVED_SHIFT
+        captures_only = self.captures_only
 
-        for move in knight_moves:
+        for move in self.knight_directions:
             new_row = row + move[0]
             new_col = col + move[1]
 
             # knight can jump over pieces, so we don't need to check for empty squares in between
             if 0 <= new_row < 8 and 0 <= new_col < 8:
-                end_piece = self.board[new_row][new_col]
+                end_piece = board[new_row][new_col]
                 if end_piece[0] != ally_color: # not a friendly piece; either empty or enemy piece
-                    moves.append(Move((row, col), (new_row, new_col), self.board))
-
+                    if captures_only and end_piece == "--":
+                        continue
+                    moves.append(packed_move(move_base | (new_row * 8 + new_col) << END_SHIFT |
+                                             PIECE_CODES[end_piece] << CAPTURED_SHIFT))
 
     def get_bishop_moves(self, row, col, moves):
         """Get all possible moves for a bishop"""
         directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)] # up-left, up-right, down-left, down-right
+        self.get_sliding_moves(row, col, directions, moves)
+
+    def get_queen_moves(self, row, col, moves):
+        """Get all possible moves for a queen"""
+        # queen moves like a rook and bishop combined
+        # so we can just call the rook and bishop move functions
+        self.get_rook_moves(row, col, moves)
+        self.get_bishop_moves(row, col, moves)
+
+    def get_sliding_moves(self, row, col, directions, moves):
+        """Get all possible moves for a piece sliding along the given directions"""
+        pin_direction = self.get_pin_direction(row, col)
         enemy_color = "b" if self.white_to_move else "w"
+        board = self.board
+        move_base = (row * 8 + col) | PIECE_CODES[board[row][col]] << MOVED_SHIFT
+        captures_only = self.captures_only
 
         for dir in directions:
-            for i in range(1, 8): # can move at max 7 squares diagonally
+            # a pinned piece can only slide towards the pinning piece or back towards its king
+            if pin_direction != () and pin_direction != dir and pin_direction != (-dir[0], -dir[1]):
+                continue
+            for i in range(1, 8): # can move at max 7 squares in a direction
                 # calculate the new row and column
                 new_row = row + dir[0] * i
                 new_col = col + dir[1] * i
                 if 0 <= new_row < 8 and 0 <= new_col < 8: # check if the new square is on the board
 
-                    end_piece = self.board[new_row][new_col]
+                    end_piece = board[new_row][new_col]
                     if end_piece == "--":
-                        moves.append(Move((row, col), (new_row, new_col), self.board))
+                        if not captures_only:
+                            moves.append(packed_move(move_base | (new_row * 8 + new_col) << END_SHIFT))
 
                     elif end_piece[0] == enemy_color: # capture the piece
-                        moves.append(Move((row, col), (new_row, new_col), self.board))
+                        moves.append(packed_move(move_base | (new_row * 8 + new_col) << END_SHIFT |
+                                                 PIECE_CODES[end_piece] << CAPTURED_SHIFT))
                         break # stop moving in this direction
 
                     else: # friendly piece
@@ -289,32 +994,160 @@ class GameState:
                 else:
                     break
 
-    def get_queen_moves(self, row, col, moves):
-        """Get all possible moves for a queen"""
-        # queen moves like a rook and bishop combined
-        # so we can just call the rook and bishop move functions
-        self.get_rook_moves(row, col, moves)
-        self.get_bishop_moves(row, col, moves)
-
     def get_king_moves(self, row, col, moves):
         """Get all possible moves for a king"""
         # king can move one square in any direction, so we can just check all 8 possible moves
-        king_moves = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
         ally_color = "w" if self.white_to_move else "b"
+        move_base = (row * 8 + col) | PIECE_CODES[ally_color + "K"] << MOVED_SHIFT
 
-        for i in range(len(king_moves)):
-            new_row = row + king_moves[i][0]
-            new_col = col + king_moves[i][1]
+        for i in range(len(self.king_directions)):
+            new_row = row + self.king_directions[i][0]
+            new_col = col + self.king_directions[i][1]
 
             if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    end_piece = self.board[new_row][new_col]
-                    if end_piece[0] != ally_color: # not a friendly piece; either empty or enemy piece
-                        moves.append(Move((row, col), (new_row, new_col), self.board))
+                end_piece = self.board[new_row][new_col]
+                if end_piece[0] != ally_color: # not a friendly piece; either empty or enemy piece
+                    if self.captures_only and end_piece == "--":
+                        continue
+                    # lift the king off its square, so it does not block the rays through it,
+                    # and check if the end square is attacked
+                    self.board[row][col] = "--"
+                    under_attack = self.square_under_attack(new_row, new_col)
+                    self.board[row][col] = ally_color + "K"
+                    if not under_attack:
+                        moves.append(packed_move(move_base | (new_row * 8 + new_col) << END_SHIFT |
+                                                 PIECE_CODES[end_piece] << CAPTURED_SHIFT))
+
+
+class MoveSet(list):
+    """Valid moves of a position, indexed by start square and by key so the UI can look them up in O(1)"""
+    # the indexes are built once, the list should not be changed afterwards apart from reordering
+
+    def __init__(self, moves=()):
+        super().__init__(moves)
+        self.by_start = {}  # start square: the moves from it
+        self.by_key = {}  # start and end squares and promotion piece: the move
+        self.by_id = {}  # start and end squares: the first move between them
+        for move in self:
+            value = move.value
+            self.by_start.setdefault(value & 63, []).append(move)
+            self.by_key[value & MOVE_KEY_MASK] = move
+            self.by_id.setdefault(value & MOVE_ID_MASK, move)
+
+    def __contains__(self, move):
+        return isinstance(move, Move) and move.value & MOVE_KEY_MASK in self.by_key
+
+    def from_square(self, row, col):
+        """Get the moves of the piece on a square"""
+        return self.by_start.get(row * 8 + col, [])
+
+    def find(self, start_square, end_square, promotion_choice=None):
+        """Get the valid move between two squares, None if there is none"""
+        # without a promotion choice, the first promotion between the squares is found
+        start_row, start_col = start_square
+        end_row, end_col = end_square
+        key = (start_row * 8 + start_col) | (end_row * 8 + end_col) << END_SHIFT
+        if promotion_choice is None:
+            return self.by_id.get(key)
+        return self.by_key.get(key | PROMOTION_PIECES.index(promotion_choice) << PROMOTION_SHIFT)
+
+
+class MoveLog:
+    """Moves made in a game as packed ints, optionally keeping only the latest ones in memory"""
+    RECORD = 4  # bytes per move in the spill file
+
+    def __init__(self, limit=None, spill_path=None):
+        # once more than twice the limit of moves are in memory, the oldest ones beyond the limit are
+        # written to the spill file, or dropped when there is none
+        self.limit = limit
+        self.spill_path = spill_path
+        self.moves = array("I")
+        self.dropped = 0  # moves no longer in memory, in the spill file if there is one
+        self.spill_file = None  # opened on the first spill
+
+    def __len__(self):
+        return self.dropped + len(self.moves)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("move log index out of range")
+        if index >= self.dropped:
+            return packed_move(self.moves[index - self.dropped])
+        if self.spill_path is None:
+            raise IndexError("move no longer in the move log")
+        spill_file = self.get_spill_file()
+        spill_file.seek(index * self.RECORD)
+        return packed_move(int.from_bytes(spill_file.read(self.RECORD), "little"))
+
+    def __iter__(self):
+        for index in range(0 if self.spill_path is not None else self.dropped, len(self)):
+            yield self[index]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["spill_file"] = None  # reopened when needed
+        return state
+
+    def get_spill_file(self):
+        if self.spill_file is None:
+            # the file is only kept from an earlier log when it holds this log's moves
+            mode = "r+b" if self.dropped and os.path.exists(self.spill_path) else "w+b"
+            self.spill_file = open(self.spill_path, mode)
+        return self.spill_file
+
+    def append(self, move):
+        self.moves.append(move.value)
+        if self.limit is not None and len(self.moves) > 2 * self.limit:
+            count = len(self.moves) - self.limit
+            if self.spill_path is not None:
+                spill_file = self.get_spill_file()
+                spill_file.seek(self.dropped * self.RECORD)
+                spill_file.write(self.moves[:count].tobytes())
+            del self.moves[:count]
+            self.dropped += count
+
+    def pop(self):
+        """Remove the last move and return it, None if it was dropped"""
+        if not self.moves and self.dropped:
+            if self.spill_path is None:
+                self.dropped -= 1
+                return None
+            # bring back the latest spilled moves
+            count = min(self.dropped, self.limit or 1)
+            spill_file = self.get_spill_file()
+            spill_file.seek((self.dropped - count) * self.RECORD)
+            self.moves.frombytes(spill_file.read(count * self.RECORD))
+            self.dropped -= count
+            spill_file.truncate(self.dropped * self.RECORD)
+        return packed_move(self.moves.pop())
+
+    def copy(self):
+        """Get a copy of the moves in memory; the copy does not share the spill file"""
+        move_log = MoveLog(self.limit)
+        move_log.moves = array("I", self.moves)
+        move_log.dropped = self.dropped
+        return move_log
+
+    def clear(self):
+        self.moves = array("I")
+        self.dropped = 0
+        if self.spill_file is not None:
+            self.spill_file.truncate(0)
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
 
 
 class Move:
     """Class to store a move made by a player"""
 
+    # the whole move is packed into one int, and the familiar attributes are decoded from it on demand
+    __slots__ = ("value",)
+
     # using rank and file notation for the chess board
     # ranks are called rows -> 1-8 (1 is the first row, 8 is the last row)
     # files are called columns -> a-h (a is the first column, h is the last column)
@@ -344,36 +1177,104 @@ class Move:
     cols_to_files = {v: k for k, v in files_to_cols.items()}
 
     def __init__(self, start_square, end_square, board, is_en_passant_move=False, promotion_choice=None):
-        self.start_row = start_square[0]
-        self.start_col = start_square[1]
-        self.end_row = end_square[0]
-        self.end_col = end_square[1]
+        # this is how moves are built from the player's clicks;
+        # the move generators pack the value themselves and never read the board here
+        start_row, start_col = start_square
+        end_row, end_col = end_square
+
+        piece_moved = board[start_row][start_col]
+        piece_captured = board[end_row][end_col]
 
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_captured = board[self.end_row][self.end_col]
+        # en passant
+        if is_en_passant_move:
+            piece_captured = "wP" if piece_moved == "bP" else "bP"
 
-        self.move_id = self.start_row + self.start_col * 10 + self.end_row * 100 + self.end_col * 1000
+        value = (start_row * 8 + start_col) | (end_row * 8 + end_col) << END_SHIFT | \
+            PIECE_CODES[piece_moved] << MOVED_SHIFT | PIECE_CODES[piece_captured] << CAPTURED_SHIFT
 
         # pawn promotion
-        self.is_pawn_promotion = (self.piece_moved == 'wP' and self.end_row == 0) or (self.piece_moved == 'bP' and self.end_row == 7)
-        self.promotion_choice = promotion_choice
+        if (piece_moved == 'wP' and end_row == 0) or (piece_moved == 'bP' and end_row == 7):
+            value |= PAWN_PROMOTION_FLAG
+        if promotion_choice:
+            value |= PROMOTION_PIECES.index(promotion_choice) << PROMOTION_SHIFT
+        if is_en_passant_move:
+            value |= EN_PASSANT_FLAG
 
-        # en passant
-        self.is_en_passant_move = is_en_passant_move
-        if self.is_en_passant_move:
-            self.piece_captured = "wP" if self.piece_moved == "bP" else "bP"
+        self.value = value
+
+    @property
+    def start_row(self):
+        return (self.value >> 3) & 7
+
+    @property
+    def start_col(self):
+        return self.value & 7
+
+    @property
+    def end_row(self):
+        return (self.value >> 9) & 7
+
+    @property
+    def end_col(self):
+        return (self.value >> END_SHIFT) & 7
+
+    @property
+    def piece_moved(self):
+        return PIECES[(self.value >> MOVED_SHIFT) & 15]
 
+    @property
+    def piece_captured(self):
+        return PIECES[(self.value >> CAPTURED_SHIFT) & 15]
+
+    @property
+    def promotion_choice(self):
+        return PROMOTION_PIECES[(self.value >> PROMOTION_SHIFT) & 7]
+
+    @property
+    def is_pawn_promotion(self):
+        return self.value & PAWN_PROMOTION_FLAG != 0
+
+    @property
+    def is_en_passant_move(self):
+        return self.value & EN_PASSANT_FLAG != 0
+
+    @property
+    def move_id(self):
+        """Id made of the start and end squares only"""
+        return self.value & MOVE_ID_MASK
 
     def __eq__(self, other):
         """Check if two moves are equal"""
         if isinstance(other, Move):
-            return self.move_id == other.move_id
+            return self.value & MOVE_KEY_MASK == other.value & MOVE_KEY_MASK
         return False
 
+    def __hash__(self):
+        return self.value & MOVE_KEY_MASK
+
     def get_chess_notation(self):
         """returns the chess notation of the move"""
         return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
 
+    def get_uci_notation(self):
+        """returns the move in UCI notation, the chess notation followed by the promotion piece"""
+        return self.get_chess_notation() + (self.promotion_choice or "").lower()
+
     def get_rank_file(self, row, col):
         """returns the rank and file of the square"""
-        return self.cols_to_files[col] + self.rows_to_ranks[row]
\ No newline at end of file
+        return self.cols_to_files[col] + self.rows_to_ranks[row]
+
+
+_new_move = object.__new__
+
+
+def restore_snapshot(cls, data, eval_tables=None):
+    """Unpickle a game state pickled as a snapshot"""
+    return cls.from_snapshot(data, eval_tables)
+
+
+def packed_move(value):
+    """Create a move straight from its packed value"""
+    move = _new_move(Move)
+    move.value = value
+    return move
@@ -5,10 +5,18 @@ displaying current GameState object
 import pygame as p
 import chess_ai
 import chess_engine
+import bitboard_engine
 from graphics import Graphics
 import configs
 
 
+def new_game_state():
+    """Create a game state using the engine backend chosen in configs"""
+    if configs.USE_BITBOARDS:
+        return bitboard_engine.BitboardGameState()
+    return chess_engine.GameState()
+
+
 # main game driver
 def main():
     p.init()  # initialize pygame
@@ -16,9 +24,9 @@ def main():
     screen = p.display.set_mode((configs.WIDTH, configs.HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = chess_engine.GameState()
+    gs = new_game_state()
 
-    valid_moves = gs.get_valid_moves()  # get all valid moves for the current player
+    valid_moves = gs.get_indexed_moves()  # get all valid moves for the current player, indexed by square
     move_made = False  # flag to check if a move was made
     animate = False  # flag to check if animation is needed
 
@@ -35,7 +43,7 @@ def main():
 
     player_one = True  # True if human is playing, False if AI is playing
     player_two = False  # True if human is playing, False if AI is playing
-
+    ai_job = None  # search running in the background while it's the AI's turn
 
     running = True
     while running:
@@ -44,6 +52,9 @@ def main():
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+                if ai_job is not None:
+                    ai_job.cancel()
+                    ai_job = None
                 
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not game_over and human_turn:  # only allow clicks if the game is not over
@@ -64,12 +75,8 @@ def main():
                             print(move.get_chess_notation())
 
                             # Check if the move is in valid moves
-                            valid_move = None
-                            for i in range(len(valid_moves)):
-                                if move == valid_moves[i]:
-                                    valid_move = valid_moves[i]
-                                    break
-                                    
+                            # (found by squares only, the promotion piece is picked from the menu afterwards)
+                            valid_move = valid_moves.find(player_clicks[0], player_clicks[1])
                             if valid_move:
                                 # If the move is a pawn promotion
                                 if valid_move.is_pawn_promotion:
@@ -97,20 +104,26 @@ def main():
                         )
                         
                         if promotion_choice:
-                            # Create a new move with the promotion choice
-                            new_promotion_move = chess_engine.Move(
+                            # Look up the valid move with the promotion choice
+                            new_promotion_move = valid_moves.find(
                                 (promotion_move.start_row, promotion_move.start_col),
                                 (promotion_move.end_row, promotion_move.end_col),
-                                gs.board,
-                                promotion_choice=promotion_choice
+                                promotion_choice
                             )
                             gs.make_move(new_promotion_move)
                             move_made = True
                             promotion_active = False
                             promotion_move = None
 
+            elif e.type == p.VIDEOEXPOSE:
+                Graphics.invalidate()  # the window was covered, draw it all again
+
             # handle key presses
             elif e.type == p.KEYDOWN:
+                if e.key in (p.K_z, p.K_ESCAPE) and ai_job is not None:
+                    ai_job.cancel()  # the position the AI is thinking about is going away
+                    ai_job = None
+
                 if e.key == p.K_z:  # undo the last move made
                     gs.undo_move()
                     move_made = True
@@ -121,8 +134,8 @@ def main():
                 
                 # reset the game state if 'Esc' is pressed
                 if e.key == p.K_ESCAPE:
-                    gs = chess_engine.GameState()  
-                    valid_moves = gs.get_valid_moves()  
+                    gs = new_game_state()
+                    valid_moves = gs.get_indexed_moves()
                     square_selected = ()  
                     player_clicks = [] 
                     move_made = False  
@@ -131,17 +144,23 @@ def main():
                     promotion_move = None  
                     game_over = False  
 
-        # AI move
-        if not game_over and not human_turn:
-            ai_move = chess_ai.ChessAI.find_best_move_min_max(gs, valid_moves)  # get the best move from AI
-            gs.make_move(ai_move)
-            move_made = True
-            animate = True
+        # AI move: the search runs in the background and the loop keeps drawing until its move is ready
+        human_turn = (gs.white_to_move and player_one) or (not gs.white_to_move and player_two)
+        if running and not game_over and not human_turn and not move_made:
+            if ai_job is None:
+                ai_job = chess_ai.ChessAI.start_search(gs, valid_moves)
+            elif ai_job.done():
+                ai_move = ai_job.result()
+                ai_job = None
+                if ai_move is not None:
+                    gs.make_move(ai_move)
+                    move_made = True
+                    animate = True
 
         if move_made:
             if animate:
-                Graphics.animate_move(gs.move_log[-1], screen, gs.board, clock)
-            valid_moves = gs.get_valid_moves()
+                Graphics.animate_move(gs.last_move(), screen, gs.board, clock)
+            valid_moves = gs.get_indexed_moves()
             move_made = False
             animate = False
 
@@ -165,7 +184,7 @@ def main():
             game_over = True
             Graphics.display_text(screen, "Stalemate!")
 
-        p.display.flip()
+        Graphics.update_display(screen)
         clock.tick(configs.MAX_FPS)
 
 if __name__ == "__main__":
@@ -4,6 +4,8 @@ WIDTH = HEIGHT = 512  # assuming 512x512 board size based on your code
 DIMENSION = 8  # 8x8 chess board
 SQUARE_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15
+DIRTY_RECTS = True  # redraw and update only the squares that changed, instead of the whole screen every frame
+USE_BITBOARDS = True  # use the bitboard backed game state for move generation
 
 # Images dictionary
 IMAGES = {}
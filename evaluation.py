@@ -0,0 +1,273 @@
+"""
+piece values and piece-square tables used to evaluate positions
+GameState keeps running middlegame and endgame totals of these tables while moves are made,
+so a position can be evaluated without looking at the board
+
+the pawn structure (doubled, isolated and passed pawns) is scored apart by EvaluationTables.evaluate_pawns,
+from the pawns alone, so the search can keep its scores in a table keyed by the pawn key of the position
+
+positions can also be evaluated many at a time with NumPy: encode_boards and encode_fens turn them into
+an (N, 64) int8 array of piece codes, and EvaluationTables.evaluate_batch scores all of them at once,
+pawn structure included
+NumPy is only imported by these functions, so the engine itself does not need it
+"""
+from chess_engine import PIECES, PIECE_CODES
+
+# bytes.translate table from the FEN piece letters to piece codes, 255 for anything else
+FEN_CODES = bytes(PIECE_CODES[("w" if chr(char).isupper() else "b") + chr(char).upper()]
+                  if chr(char) in "PRNBQKprnbqk" else 0 if chr(char) == "." else 255 for char in range(256))
+
+# all the tables are written from white's point of view, with the first row being the 8th rank
+PAWN_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+PAWN_ENDGAME_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    20, 20, 20, 20, 20, 20, 20, 20,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+)
+QUEEN_TABLE = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+)
+KING_TABLE = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+)
+KING_ENDGAME_TABLE = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+)
+
+
+# masks of the squares, numbered row * 8 + col, used by the pawn structure evaluation
+FILE_MASKS = tuple(0x0101010101010101 << col for col in range(8))
+ADJACENT_FILE_MASKS = tuple((FILE_MASKS[col - 1] if col > 0 else 0) | (FILE_MASKS[col + 1] if col < 7 else 0)
+                            for col in range(8))
+# the squares in front of a pawn on its own and the adjacent files, where no enemy pawn may be for it to be passed
+WHITE_PASSED_MASKS = tuple((FILE_MASKS[square % 8] | ADJACENT_FILE_MASKS[square % 8]) & ((1 << (square & 56)) - 1)
+                           for square in range(64))
+BLACK_PASSED_MASKS = tuple((FILE_MASKS[square % 8] | ADJACENT_FILE_MASKS[square % 8]) & ~((1 << (square | 7) + 1) - 1)
+                           for square in range(64))
+
+
+class EvaluationTables:
+    """Piece values and piece-square tables, combined into one signed table per piece code"""
+    # the phase falls from MAX_PHASE with all the pieces on the board to 0 with only kings and pawns
+    MAX_PHASE = 24
+
+    # pawn structure terms as (middlegame, endgame), for the side of the pawn
+    DOUBLED_PAWN = (-10, -20)  # every pawn on a file beyond the first one
+    ISOLATED_PAWN = (-10, -15)  # no pawn of its side on the adjacent files
+    PASSED_PAWN = ((0, 0), (5, 10), (10, 20), (15, 35), (25, 60), (40, 90), (60, 130), (0, 0))  # by ranks advanced
+
+    def __init__(self, middlegame_values, endgame_values, middlegame_tables, endgame_tables, phase_values):
+        # each argument maps a piece type (P, R, N, B, Q, K) to its value or its table for white
+        # mg[code][square] and eg[code][square] are positive for white pieces and negative for black ones,
+        # black's tables being white's tables mirrored top to bottom
+        self.mg = []
+        self.eg = []
+        self.phase = []
+        for piece in PIECES:
+            if piece == "--":
+                self.mg.append([0] * 64)
+                self.eg.append([0] * 64)
+                self.phase.append(0)
+                continue
+            color, piece_type = piece
+            sign = 1 if color == "w" else -1
+            mg = []
+            eg = []
+            for square in range(64):
+                table_square = square if color == "w" else (7 - square // 8) * 8 + square % 8
+                mg.append(sign * (middlegame_values[piece_type] + middlegame_tables[piece_type][table_square]))
+                eg.append(sign * (endgame_values[piece_type] + endgame_tables[piece_type][table_square]))
+            self.mg.append(mg)
+            self.eg.append(eg)
+            self.phase.append(phase_values[piece_type])
+
+        self.arrays = None  # the tables as NumPy arrays, made on the first batch evaluation
+
+    def blend(self, mg_score, eg_score, phase):
+        """Blend the middlegame and endgame scores by the phase of the game"""
+        phase = min(phase, self.MAX_PHASE)
+        return (mg_score * phase + eg_score * (self.MAX_PHASE - phase)) // self.MAX_PHASE
+
+    def evaluate_pawns(self, white_pawns, black_pawns):
+        """Score the pawn structure from the pawn squares as (middlegame, endgame), positive when white is better"""
+        mg_score = eg_score = 0
+        for pawns, enemy_pawns, passed_masks, sign in ((white_pawns, black_pawns, WHITE_PASSED_MASKS, 1),
+                                                       (black_pawns, white_pawns, BLACK_PASSED_MASKS, -1)):
+            for col in range(8):
+                count = (pawns & FILE_MASKS[col]).bit_count()
+                if not count:
+                    continue
+                if count > 1:
+                    mg_score += sign * self.DOUBLED_PAWN[0] * (count - 1)
+                    eg_score += sign * self.DOUBLED_PAWN[1] * (count - 1)
+                if not pawns & ADJACENT_FILE_MASKS[col]:
+                    mg_score += sign * self.ISOLATED_PAWN[0] * count
+                    eg_score += sign * self.ISOLATED_PAWN[1] * count
+            remaining = pawns
+            while remaining:
+                square = (remaining & -remaining).bit_length() - 1
+                remaining &= remaining - 1
+                # only the front pawn of a doubled pawn counts as passed
+                if not (enemy_pawns | pawns & FILE_MASKS[square % 8]) & passed_masks[square]:
+                    ranks_advanced = 6 - square // 8 if sign == 1 else square // 8 - 1
+                    mg_bonus, eg_bonus = self.PASSED_PAWN[ranks_advanced]
+                    mg_score += sign * mg_bonus
+                    eg_score += sign * eg_bonus
+        return mg_score, eg_score
+
+    def evaluate_pawns_batch(self, codes):
+        """Score the pawn structure of an (N, 64) array of piece codes like evaluate_pawns, as N (mg, eg) pairs"""
+        import numpy as np
+        codes = np.asarray(codes).reshape(-1, 8, 8)
+        white = codes == PIECE_CODES["wP"]
+        black = codes == PIECE_CODES["bP"]
+        mg_scores = np.zeros(len(codes), dtype=np.int32)
+        eg_scores = np.zeros(len(codes), dtype=np.int32)
+        # bonus of a passed pawn by its row, for white; black's pawns are mirrored top to bottom to score alike
+        mg_bonus = np.array([self.PASSED_PAWN[6 - row][0] for row in range(8)], dtype=np.int32)
+        eg_bonus = np.array([self.PASSED_PAWN[6 - row][1] for row in range(8)], dtype=np.int32)
+        for pawns, enemy_pawns, sign in ((white, black, 1), (black[:, ::-1], white[:, ::-1], -1)):
+            counts = pawns.sum(axis=1, dtype=np.int32)  # pawns on every file
+            doubled = np.maximum(counts - 1, 0).sum(axis=1)
+            neighbours = np.zeros_like(counts)
+            neighbours[:, 1:] += counts[:, :-1]
+            neighbours[:, :-1] += counts[:, 1:]
+            isolated = np.where(neighbours == 0, counts, 0).sum(axis=1)
+            # the squares with a pawn somewhere in front of them on their file
+            own_ahead = np.zeros_like(pawns)
+            own_ahead[:, 1:] = np.logical_or.accumulate(pawns, axis=1)[:, :-1]
+            enemy_ahead = np.zeros_like(pawns)
+            enemy_ahead[:, 1:] = np.logical_or.accumulate(enemy_pawns, axis=1)[:, :-1]
+            blocked = own_ahead | enemy_ahead
+            blocked[:, :, 1:] |= enemy_ahead[:, :, :-1]
+            blocked[:, :, :-1] |= enemy_ahead[:, :, 1:]
+            passed = (pawns & ~blocked).sum(axis=2, dtype=np.int32)  # passed pawns on every row
+            mg_scores += sign * (self.DOUBLED_PAWN[0] * doubled + self.ISOLATED_PAWN[0] * isolated + passed @ mg_bonus)
+            eg_scores += sign * (self.DOUBLED_PAWN[1] * doubled + self.ISOLATED_PAWN[1] * isolated + passed @ eg_bonus)
+        return mg_scores, eg_scores
+
+    def evaluate_batch(self, codes, pawn_structure=True):
+        """Evaluate an (N, 64) array of piece codes at once, returning N scores, positive when white is better"""
+        import numpy as np
+        if self.arrays is None:
+            self.arrays = (np.array(self.mg, dtype=np.int32), np.array(self.eg, dtype=np.int32),
+                           np.array(self.phase, dtype=np.int32))
+        mg, eg, phase_values = self.arrays
+        codes = np.asarray(codes, dtype=np.intp)
+        squares = np.arange(64)
+        # the value of every piece on its square is looked up for all the positions at once,
+        # the same sums GameState keeps up to date move by move
+        mg_scores = mg[codes, squares].sum(axis=1)
+        eg_scores = eg[codes, squares].sum(axis=1)
+        if pawn_structure:
+            pawn_mg, pawn_eg = self.evaluate_pawns_batch(codes)
+            mg_scores += pawn_mg
+            eg_scores += pawn_eg
+        phase = np.minimum(phase_values[codes].sum(axis=1), self.MAX_PHASE)
+        return (mg_scores * phase + eg_scores * (self.MAX_PHASE - phase)) // self.MAX_PHASE
+
+
+def encode_boards(boards):
+    """Encode boards, as in GameState.board, into an (N, 64) int8 array of piece codes"""
+    import numpy as np
+    data = bytes(PIECE_CODES[piece] for board in boards for row in board for piece in row)
+    return np.frombuffer(data, dtype=np.int8).reshape(-1, 64)
+
+
+def encode_fen_board(fen):
+    """Encode the piece placement of a FEN into 64 bytes of piece codes, raising ValueError when it is not one"""
+    # the empty squares are spelled out, so every rank is 8 characters long and followed by a slash
+    placement = fen.split(" ", 1)[0]
+    for digit in "12345678":
+        placement = placement.replace(digit, "." * int(digit))
+    if len(placement) != 71 or placement[8::9] != "///////":
+        raise ValueError(f"invalid piece placement in FEN: {fen}")
+    data = placement.replace("/", "").encode("ascii", "replace").translate(FEN_CODES)
+    if 255 in data:
+        raise ValueError(f"invalid piece placement in FEN: {fen}")
+    return data
+
+
+def encode_fens(fens):
+    """Encode the positions of FENs into an (N, 64) int8 array of piece codes, and whether white is to move"""
+    import numpy as np
+    fens = list(fens)
+    codes = np.frombuffer(b"".join(encode_fen_board(fen) for fen in fens), dtype=np.int8).reshape(-1, 64)
+    white_to_move = np.array([fen.split()[1:2] != ["b"] for fen in fens], dtype=bool)
+    return codes, white_to_move
+
+
+DEFAULT_TABLES = EvaluationTables(
+    middlegame_values={"P": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0},
+    endgame_values={"P": 120, "N": 300, "B": 320, "R": 520, "Q": 930, "K": 0},
+    middlegame_tables={"P": PAWN_TABLE, "N": KNIGHT_TABLE, "B": BISHOP_TABLE, "R": ROOK_TABLE,
+                       "Q": QUEEN_TABLE, "K": KING_TABLE},
+    endgame_tables={"P": PAWN_ENDGAME_TABLE, "N": KNIGHT_TABLE, "B": BISHOP_TABLE, "R": ROOK_TABLE,
+                    "Q": QUEEN_TABLE, "K": KING_ENDGAME_TABLE},
+    phase_values={"P": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0},
+)
@@ -2,15 +2,77 @@ import pygame as p
 import configs
 
 class Graphics:
+    # pre-rendered layers, created on first use: the empty board, the highlight squares and the fonts
+    board_surface = None
+    highlight_surfaces = None
+    fonts = {}
+
+    # dirty rectangle rendering: what every square shows on screen, as (piece, highlight), so only the
+    # squares whose contents changed are drawn again, and the screen areas drawn during the frame
+    drawn_squares = [None] * 64
+    square_states = [None] * 64  # what every square should show, set by draw_game_state
+    dirty_rects = []
+    overlays = {}  # menus and texts on screen, by key: their rectangle
+    frame_overlays = {}  # the overlays drawn during the frame
+
+    NO_HIGHLIGHT = 0
+    SELECTED = 1
+    HIGHLIGHTED = 2
+
+    @staticmethod
+    def square_rect(row, col):
+        return p.Rect(col * configs.SQUARE_SIZE, row * configs.SQUARE_SIZE, configs.SQUARE_SIZE, configs.SQUARE_SIZE)
+
+    @staticmethod
+    def get_board_surface():
+        """Get the empty board, drawn once"""
+        if Graphics.board_surface is None:
+            surface = p.Surface((configs.WIDTH, configs.HEIGHT))
+            Graphics.draw_board(surface)
+            Graphics.board_surface = surface.convert() if p.display.get_surface() is not None else surface
+        return Graphics.board_surface
+
+    @staticmethod
+    def get_highlight_surfaces():
+        """Get the translucent squares of the selected piece and of its moves, indexed by highlight"""
+        if Graphics.highlight_surfaces is None:
+            surfaces = [None]
+            for color in (configs.SELECTED_COLOR, configs.HIGHLIGHT_COLOR):
+                surface = p.Surface((configs.SQUARE_SIZE, configs.SQUARE_SIZE))
+                surface.set_alpha(100)
+                surface.fill(p.Color(color))
+                surfaces.append(surface)
+            Graphics.highlight_surfaces = surfaces
+        return Graphics.highlight_surfaces
+
+    @staticmethod
+    def get_font(name, size, bold=False, italic=False):
+        """Get a font, loaded once"""
+        key = (name, size, bold, italic)
+        if key not in Graphics.fonts:
+            Graphics.fonts[key] = p.font.SysFont(name, size, bold, italic)
+        return Graphics.fonts[key]
+
+    @staticmethod
+    def invalidate(rect=None):
+        """Forget what is on screen in the area, or the whole screen, so the next frame draws it again"""
+        if rect is None:
+            Graphics.drawn_squares = [None] * 64
+            Graphics.overlays = {}
+            return
+        for square in range(64):
+            if rect.colliderect(Graphics.square_rect(square // 8, square % 8)):
+                Graphics.drawn_squares[square] = None
+        Graphics.overlays = {key: overlay for key, overlay in Graphics.overlays.items() if not rect.colliderect(overlay)}
+
     @staticmethod
     def draw_board(screen):
         """Draw the squares on the board"""
-        colors = [p.Color("white"), p.Color("burlywood4")]
+        colors = [configs.LIGHT_SQUARE, configs.DARK_SQUARE]
         for r in range(configs.DIMENSION):
             for c in range(configs.DIMENSION):
                 color = colors[(r + c) % 2]
-                p.draw.rect(screen, color, p.Rect(c * configs.SQUARE_SIZE, r * configs.SQUARE_SIZE, 
-                                                configs.SQUARE_SIZE, configs.SQUARE_SIZE))
+                p.draw.rect(screen, color, Graphics.square_rect(r, c))
 
     @staticmethod
     def draw_pieces(screen, board):
@@ -19,56 +81,94 @@ class Graphics:
             for c in range(configs.DIMENSION):
                 piece = board[r][c]
                 if piece != "--":  # not empty square
-                    screen.blit(configs.IMAGES[piece], p.Rect(c * configs.SQUARE_SIZE, r * configs.SQUARE_SIZE, 
-                                                        configs.SQUARE_SIZE, configs.SQUARE_SIZE))
+                    screen.blit(configs.IMAGES[piece], Graphics.square_rect(r, c))
+
     @staticmethod
-    def highlight_squares(screen, gs, valid_moves, selected_square):
-        """Highlight the squares on the board"""
+    def get_highlights(gs, valid_moves, selected_square):
+        """Get the highlight of every square: the selected piece that can be moved and the squares it can go to"""
+        highlights = [Graphics.NO_HIGHLIGHT] * 64
         if selected_square != ():
             row, col = selected_square
             # selected square is a piece that can be moved
             if gs.board[row][col][0] == ('w' if gs.white_to_move else 'b'):
-                surface = p.Surface((configs.SQUARE_SIZE, configs.SQUARE_SIZE))
-                surface.set_alpha(100)
-                surface.fill(p.Color(configs.SELECTED_COLOR))
-                screen.blit(surface, (col * configs.SQUARE_SIZE, row * configs.SQUARE_SIZE))
+                highlights[row * 8 + col] = Graphics.SELECTED
+                for move in valid_moves.from_square(row, col):
+                    highlights[move.value >> 6 & 63] = Graphics.HIGHLIGHTED  # the end square
+        return highlights
 
-                # highlight valid moves
-                surface.fill(p.Color(configs.HIGHLIGHT_COLOR))
-                for move in valid_moves:
-                    if move.start_row == row and move.start_col == col:
-                        screen.blit(surface, (move.end_col * configs.SQUARE_SIZE, move.end_row * configs.SQUARE_SIZE))
+    @staticmethod
+    def draw_square(screen, square):
+        """Draw a square as it should be: the board, its highlight and its piece"""
+        piece, highlight = Graphics.square_states[square]
+        rect = Graphics.square_rect(square // 8, square % 8)
+        screen.blit(Graphics.get_board_surface(), rect, rect)
+        if highlight:
+            screen.blit(Graphics.get_highlight_surfaces()[highlight], rect)
+        if piece != "--":
+            screen.blit(configs.IMAGES[piece], rect)
+        Graphics.drawn_squares[square] = Graphics.square_states[square]
+        Graphics.dirty_rects.append(rect)
 
     @staticmethod
     def draw_game_state(screen, gs, valid_moves, selected_square):
-        """Draw the current state of the game"""
-        Graphics.draw_board(screen)  # draw squares on the board
-        Graphics.highlight_squares(screen, gs, valid_moves, selected_square)
-        Graphics.draw_pieces(screen, gs.board)  # draw pieces on top of squares
-        
+        """Draw the squares of the current state of the game that changed since the last frame"""
+        if not configs.DIRTY_RECTS:
+            Graphics.invalidate()  # draw the whole board every frame
+        highlights = Graphics.get_highlights(gs, valid_moves, selected_square)
+        board = gs.board
+        Graphics.square_states = [(board[square // 8][square % 8], highlights[square]) for square in range(64)]
+        for square in range(64):
+            if Graphics.square_states[square] != Graphics.drawn_squares[square]:
+                Graphics.draw_square(screen, square)
+        Graphics.frame_overlays = {}
+
+    @staticmethod
+    def draw_overlay(screen, key, rect, draw):
+        """Draw a menu or text over the board, unless it is on screen already and nothing beneath it was drawn"""
+        if key not in Graphics.overlays or rect.collidelist(Graphics.dirty_rects) != -1:
+            draw()
+            Graphics.dirty_rects.append(rect)
+        Graphics.frame_overlays[key] = rect
+
+    @staticmethod
+    def update_display(screen):
+        """Put the frame on screen, updating only the areas drawn during it"""
+        # overlays that were not drawn this frame are gone: draw the squares they covered again
+        for key, rect in Graphics.overlays.items():
+            if key not in Graphics.frame_overlays:
+                for square in range(64):
+                    if rect.colliderect(Graphics.square_rect(square // 8, square % 8)):
+                        Graphics.draw_square(screen, square)
+        Graphics.overlays = Graphics.frame_overlays
+        Graphics.frame_overlays = {}
+        if configs.DIRTY_RECTS:
+            if Graphics.dirty_rects:
+                p.display.update(Graphics.dirty_rects)
+        else:
+            p.display.flip()
+        Graphics.dirty_rects = []
+
     @staticmethod
     def draw_promotion_menu(screen, col, promoting_white):
         """Draw the promotion menu"""
         # Background for the promotion menu
         menu_height = 4 * configs.SQUARE_SIZE
         row = 2 if promoting_white else 4  # Position the menu in a reasonable place
-        
-        # Draw background
-        p.draw.rect(screen, p.Color("dark gray"), 
-                    p.Rect(col * configs.SQUARE_SIZE, 
-                          row * configs.SQUARE_SIZE, 
-                          configs.SQUARE_SIZE, menu_height))
-        
-        # Draw pieces to choose from (Q, R, B, N)
-        color_prefix = "w" if promoting_white else "b"
-        pieces = ["Q", "R", "B", "N"]
-        
-        for i, piece in enumerate(pieces):
-            piece_key = color_prefix + piece
-            screen.blit(configs.IMAGES[piece_key], 
-                        p.Rect(col * configs.SQUARE_SIZE, 
-                              (row + i) * configs.SQUARE_SIZE, 
-                              configs.SQUARE_SIZE, configs.SQUARE_SIZE))
+        menu_rect = p.Rect(col * configs.SQUARE_SIZE, row * configs.SQUARE_SIZE, configs.SQUARE_SIZE, menu_height)
+
+        def draw():
+            # Draw background
+            p.draw.rect(screen, p.Color("dark gray"), menu_rect)
+
+            # Draw pieces to choose from (Q, R, B, N)
+            color_prefix = "w" if promoting_white else "b"
+            pieces = ["Q", "R", "B", "N"]
+
+            for i, piece in enumerate(pieces):
+                piece_key = color_prefix + piece
+                screen.blit(configs.IMAGES[piece_key], Graphics.square_rect(row + i, col))
+
+        Graphics.draw_overlay(screen, ("promotion", col, promoting_white), menu_rect, draw)
 
     @staticmethod
     def get_promotion_choice(pos, col, promoting_white):
@@ -77,55 +177,64 @@ class Graphics:
         if x // configs.SQUARE_SIZE == col:
             row = 2 if promoting_white else 4  # Match the starting row in draw_promotion_menu
             selected_row = y // configs.SQUARE_SIZE
-            
+
             if row <= selected_row < row + 4:
                 index = selected_row - row
                 return configs.PROMOTION_CHOICES[index]
-        
+
         return None  # No valid selection
-    
+
     @staticmethod
     def animate_move(move, screen, board, clock):
-        colors = [p.Color("white"), p.Color("burlywood4")]
         dRow = move.end_row - move.start_row
         dCow = move.end_col - move.start_col
 
         frames_per_square = 10  # frames to move one square
         frame_count = (abs(dRow) + abs(dCow)) * frames_per_square  # total frames to animate
 
+        # only the squares between the start and the end square change during the animation
+        area = Graphics.square_rect(move.start_row, move.start_col).union(
+            Graphics.square_rect(move.end_row, move.end_col))
+        board_surface = Graphics.get_board_surface()
+        end_square = Graphics.square_rect(move.end_row, move.end_col)
+
         # Get the piece being moved
         for frame in range(frame_count + 1): # + 1 to include the end position
             row, col = (move.start_row + dRow * frame // frame_count, move.start_col + dCow * frame // frame_count)
-            
-            Graphics.draw_board(screen)
-            Graphics.draw_pieces(screen, board)
 
-            # erase the piece from the starting square
-            color = colors[(move.end_row + move.end_col) % 2]
-            end_square = p.Rect(move.end_col * configs.SQUARE_SIZE, move.end_row * configs.SQUARE_SIZE, 
-                                configs.SQUARE_SIZE, configs.SQUARE_SIZE)
-            p.draw.rect(screen, color, end_square)
+            screen.blit(board_surface, area, area)
+            for r in range(area.top // configs.SQUARE_SIZE, area.bottom // configs.SQUARE_SIZE):
+                for c in range(area.left // configs.SQUARE_SIZE, area.right // configs.SQUARE_SIZE):
+                    # the moving piece is already on the end square of the board, draw it only where it is now
+                    if board[r][c] != "--" and (r, c) != (move.end_row, move.end_col):
+                        screen.blit(configs.IMAGES[board[r][c]], Graphics.square_rect(r, c))
 
             # draw the captured piece onto the rectangl if any
             if move.piece_captured != "--":
                 screen.blit(configs.IMAGES[move.piece_captured], end_square)
 
             # draw the moving piece
-            screen.blit(configs.IMAGES[move.piece_moved], 
-                        p.Rect(col * configs.SQUARE_SIZE, row * configs.SQUARE_SIZE, 
-                               configs.SQUARE_SIZE, configs.SQUARE_SIZE))
-            
-            p.display.flip()
-            clock.tick(60)  
+            screen.blit(configs.IMAGES[move.piece_moved], Graphics.square_rect(row, col))
+
+            p.display.update(area)
+            clock.tick(60)
+
+        # the squares of the animation no longer show what the next frame expects
+        Graphics.invalidate(area)
 
     @staticmethod
     def display_text(screen, text):
         """Display text on the screen"""
-        font = p.font.SysFont("Roboto", 50, False, True)
-        text_object = font.render(text, True, p.Color("gray"))
-        text_location = p.Rect(0, 0, configs.WIDTH, configs.HEIGHT).move(configs.WIDTH // 2 - text_object.get_width() // 2, 
-                                   configs.HEIGHT // 2 - text_object.get_height() // 2)
-        screen.blit(text_object, text_location)
-        text_object = font.render(text, True, p.Color("cyan"))
-        screen.blit(text_object, text_location.move(1, -2))  # Slightly offset for shadow effect
-        
+        font = Graphics.get_font("Roboto", 50, False, True)
+        # the text is only rendered when it has to be drawn, its size is enough to place it
+        width, height = font.size(text)
+        text_location = p.Rect(configs.WIDTH // 2 - width // 2, configs.HEIGHT // 2 - height // 2, width, height)
+        text_rect = text_location.union(text_location.move(1, -2))
+
+        def draw():
+            text_object = font.render(text, True, p.Color("gray"))
+            screen.blit(text_object, text_location)
+            text_object = font.render(text, True, p.Color("cyan"))
+            screen.blit(text_object, text_location.move(1, -2))  # Slightly offset for shadow effect
+
+        Graphics.draw_overlay(screen, ("text", text), text_rect, draw)
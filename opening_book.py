@@ -0,0 +1,135 @@
+"""
+opening book: a sorted binary file of positions and the moves played in them, read through mmap
+
+the entries use the 16 byte layout of Polyglot books (key, move, weight, learn, all big-endian),
+but the keys are the engine's own Zobrist keys, so only books built by this module can be read
+
+usage:
+    python opening_book.py games.pgn book.bin     build a book from the games of a PGN file
+    python opening_book.py games.pgn book.bin --plies 20
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from chess_engine import GameState, PROMOTION_SHIFT
+from pgn import read_games, parse_san
+
+ENTRY = struct.Struct(">QHHI")  # key, move, weight, learn
+KEY = struct.Struct(">Q")
+
+
+def encode_move(move):
+    """Pack a move the way Polyglot does: end file and rank, start file and rank, promotion piece"""
+    # Polyglot counts ranks from white's side and numbers promotions N, B, R, Q from 1,
+    # where the engine counts rows from black's side and numbers them Q, R, B, N
+    promotion = 5 - (move.value >> PROMOTION_SHIFT & 7) if move.is_pawn_promotion else 0
+    return move.end_col | (7 - move.end_row) << 3 | move.start_col << 6 | (7 - move.start_row) << 9 | promotion << 12
+
+
+class OpeningBook:
+    """Book file opened through mmap, so opening it reads nothing and the entries stay on disk"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # an empty file cannot be mapped, and has no entries anyway
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.count = size // ENTRY.size
+
+    def close(self):
+        if self.count:
+            self.data.close()
+        self.file.close()
+
+    def find_entries(self, key):
+        """Get (move, weight) of every entry of the key, found by binary search"""
+        data = self.data
+        low, high = 0, self.count
+        while low < high:  # first entry with a key not below the key
+            middle = (low + high) // 2
+            if KEY.unpack_from(data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.count:
+            entry_key, move, weight, _ = ENTRY.unpack_from(data, low * ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append((move, weight))
+            low += 1
+        return entries
+
+    def get_moves(self, gs, valid_moves):
+        """Get (move, weight) of the book moves of the position that are valid"""
+        moves = {encode_move(move): move for move in valid_moves}
+        return [(moves[code], weight) for code, weight in self.find_entries(gs.zobrist_key)
+                if code in moves and weight > 0]
+
+    def choose_move(self, gs, valid_moves, rng=random):
+        """Pick a book move with a probability proportional to its weight, None if the position is not in the book"""
+        book_moves = self.get_moves(gs, valid_moves)
+        if not book_moves:
+            return None
+        pick = rng.randrange(sum(weight for _, weight in book_moves))
+        for move, weight in book_moves:
+            pick -= weight
+            if pick < 0:
+                return move
+
+
+def build_book(pgn_path, book_path, max_plies=16):
+    """Write a book of the first plies of the games of a PGN file, returning the number of entries"""
+    # a move is weighted by the results it led to: 2 for a win, 1 for a draw or an unknown result
+    weights = {}
+    with open(pgn_path, encoding="utf-8", errors="replace") as pgn_file:
+        for headers, san_moves, result in read_games(pgn_file):
+            if "FEN" in headers:
+                continue  # only games from the initial position
+            gs = GameState()
+            for san in san_moves[:max_plies]:
+                move = parse_san(san, gs.get_valid_moves())
+                if move is None:
+                    break  # castling or a move the engine cannot follow
+                if result == "1/2-1/2" or result == "*":
+                    weight = 1
+                elif (result == "1-0") == gs.white_to_move:
+                    weight = 2
+                else:
+                    weight = 0
+                if weight:
+                    position_moves = weights.setdefault(gs.zobrist_key, {})
+                    code = encode_move(move)
+                    position_moves[code] = position_moves.get(code, 0) + weight
+                gs.make_move(move)
+
+    # weights have to fit into 16 bits
+    highest = max((weight for moves in weights.values() for weight in moves.values()), default=0)
+    scale = 65535 / highest if highest > 65535 else 1
+    count = 0
+    with open(book_path, "wb") as book_file:
+        for key in sorted(weights):
+            for code, weight in sorted(weights[key].items(), key=lambda item: -item[1]):
+                book_file.write(ENTRY.pack(key, code, max(1, int(weight * scale)), 0))
+                count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="build an opening book from a PGN file")
+    parser.add_argument("pgn", help="PGN file with the games to learn from")
+    parser.add_argument("book", help="book file to write")
+    parser.add_argument("--plies", type=int, default=16, help="plies of each game to put into the book")
+    args = parser.parse_args(argv)
+    count = build_book(args.pgn, args.book, args.plies)
+    print(f"{count} entries written to {args.book}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
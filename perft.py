@@ -0,0 +1,126 @@
+"""
+perft: counts the leaf nodes of the move generation tree to a fixed depth
+it checks get_valid_moves against known node counts and measures its speed,
+so it is run after every change to the engine
+
+usage:
+    python perft.py                       run the bundled reference positions
+    python perft.py --depth 3             ... only up to depth 3
+    python perft.py --fen FEN --depth 4 --divide
+                                          count one position and print the count of every root move
+    python perft.py --backend mailbox     use the plain GameState instead of the bitboard one
+"""
+import argparse
+import sys
+import time
+
+from chess_engine import GameState
+from bitboard_engine import BitboardGameState
+
+BACKENDS = {"mailbox": GameState, "bitboard": BitboardGameState}
+
+# (name, FEN, {depth: nodes}) - the engine does not know castling, so all the positions are without
+# castling rights; the start position cannot castle before ply 7, so its counts are the usual ones
+REFERENCE_POSITIONS = [
+    ("start position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1",
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("rook endgame with en passant", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("promotions", "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1",
+     {1: 24, 2: 496, 3: 9483, 4: 182838}),
+    ("illegal en passant 1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", {6: 1134888}),
+    ("illegal en passant 2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", {6: 1015133}),
+    ("en passant capture checks opponent", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", {6: 1440467}),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", {6: 3821001}),
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", {5: 1004658}),
+    ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", {6: 217342}),
+    ("underpromote to give check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", {6: 92683}),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", {6: 2217}),
+    ("stalemate and checkmate 1", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", {7: 567584}),
+    ("stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", {4: 23527}),
+]
+
+def perft(gs, depth):
+    """Count the leaf nodes of the move tree to the depth"""
+    moves = gs.get_valid_moves()
+    if depth == 1:
+        return len(moves)  # bulk counting: the leaves do not have to be played
+    nodes = 0
+    for move in moves:
+        gs.make_move(move)
+        nodes += perft(gs, depth - 1)
+        gs.undo_move()
+    return nodes
+
+
+def divide(gs, depth, out=sys.stdout):
+    """Print the node count below every root move, which narrows a wrong count down to one move"""
+    total = 0
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        nodes = perft(gs, depth - 1) if depth > 1 else 1
+        gs.undo_move()
+        promotion = move.promotion_choice.lower() if move.promotion_choice else ""
+        print(f"{move.get_chess_notation()}{promotion}: {nodes}", file=out)
+        total += nodes
+    print(f"total: {total}", file=out)
+    return total
+
+
+def timed_perft(gs, depth):
+    """Run perft and return the node count and the nodes per second"""
+    start = time.perf_counter()
+    nodes = perft(gs, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, nodes / elapsed if elapsed > 0 else float("inf")
+
+
+def run_suite(max_depth=None, backend=BitboardGameState, out=sys.stdout):
+    """Check every reference position against its known counts and report the speed"""
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in REFERENCE_POSITIONS:
+        for depth, expected in sorted(counts.items()):
+            if max_depth is not None and depth > max_depth:
+                continue
+            gs = backend.from_fen(fen)
+            start = time.perf_counter()
+            nodes = perft(gs, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected else f"FAILED, expected {expected}"
+            if nodes != expected:
+                failures += 1
+            print(f"{name:36} depth {depth}: {nodes:>9} nodes {nodes / max(elapsed, 1e-9):>9.0f} nps  {status}",
+                  file=out)
+    print(f"{total_nodes} nodes in {total_time:.2f}s, {total_nodes / max(total_time, 1e-9):.0f} nps, "
+          f"{failures} failed", file=out)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="count move generation leaf nodes")
+    parser.add_argument("--fen", help="position to count instead of the reference positions")
+    parser.add_argument("--depth", type=int, help="depth to count to (the deepest reference counts by default)")
+    parser.add_argument("--divide", action="store_true", help="print the count below every root move")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    args = parser.parse_args(argv)
+    backend = BACKENDS[args.backend]
+
+    if args.fen is None:
+        return 1 if run_suite(args.depth, backend) else 0
+
+    depth = args.depth or 1
+    gs = backend.from_fen(args.fen)
+    if args.divide:
+        divide(gs, depth)
+    else:
+        nodes, nps = timed_perft(gs, depth)
+        print(f"depth {depth}: {nodes} nodes, {nps:.0f} nps")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
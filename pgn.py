@@ -0,0 +1,141 @@
+"""
+reading and writing games in PGN (portable game notation), and turning SAN moves into engine moves and back
+"""
+import re
+
+from chess_engine import PROMOTION_PIECES
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+# piece, disambiguating file and rank, capture, end square and promotion piece of a SAN move
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$")
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]$')
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+
+
+def read_games(lines):
+    """Read the games of a PGN file, yielding (headers, SAN moves, result) for each one"""
+    headers = {}
+    moves = []
+    depth = 0  # nesting of the variations being skipped
+    in_comment = False
+    for line in lines:
+        line = line.strip()
+        if not in_comment and depth == 0:
+            header = HEADER_PATTERN.match(line)
+            if header:
+                if moves:  # a game without a result before the next one's headers
+                    yield headers, moves, "*"
+                    headers, moves = {}, []
+                headers[header.group(1)] = header.group(2)
+                continue
+            if line.startswith("%"):
+                continue  # escaped line
+        # make the brackets separate tokens, so they can be told apart from the moves
+        for token in re.sub(r"([(){}])", r" \1 ", line).split():
+            if in_comment:
+                in_comment = token != "}"
+            elif token == "{":
+                in_comment = True
+            elif token.startswith(";"):
+                break  # the rest of the line is a comment
+            elif token == "(":
+                depth += 1
+            elif token == ")":
+                depth = max(0, depth - 1)
+            elif depth > 0 or token.startswith("$"):
+                continue  # variations and numeric annotations
+            elif token in RESULTS:
+                yield headers, moves, token
+                headers, moves = {}, []
+            else:
+                token = MOVE_NUMBER_PATTERN.sub("", token)
+                if token:
+                    moves.append(token)
+    if moves:
+        yield headers, moves, "*"
+
+
+def parse_san(san, valid_moves):
+    """Find the valid move written in SAN, None if there is no such move"""
+    # check, mate and annotation marks are not needed to find the move
+    san = san.rstrip("+#!?").replace("e.p.", "")
+    if san.startswith("O-O") or san.startswith("0-0"):
+        return None  # the engine does not know castling
+    match = SAN_PATTERN.match(san)
+    if match is None:
+        return None
+    piece, from_file, from_rank, _, end_square, promotion = match.groups()
+    piece = piece or "P"
+    end_col = ord(end_square[0]) - ord("a")
+    end_row = 8 - int(end_square[1])
+    promotion_code = PROMOTION_PIECES.index(promotion) if promotion else 0
+    if piece == "P" and promotion_code == 0 and end_row in (0, 7):
+        promotion_code = 1  # a promotion without a piece is taken as a queen
+
+    found = None
+    for move in valid_moves:
+        if move.end_row != end_row or move.end_col != end_col or move.piece_moved[1] != piece:
+            continue
+        if from_file is not None and move.start_col != ord(from_file) - ord("a"):
+            continue
+        if from_rank is not None and move.start_row != 8 - int(from_rank):
+            continue
+        if move.is_pawn_promotion and PROMOTION_PIECES.index(move.promotion_choice) != promotion_code:
+            continue
+        if found is not None:
+            return None  # ambiguous
+        found = move
+    return found
+
+
+def move_to_san(gs, move, valid_moves):
+    """Write a valid move of the position in SAN"""
+    piece = move.piece_moved[1]
+    end_square = move.get_rank_file(move.end_row, move.end_col)
+    capture = "x" if move.piece_captured != "--" else ""
+    if piece == "P":
+        san = (move.get_rank_file(move.start_row, move.start_col)[0] + capture if capture else "") + end_square
+        if move.is_pawn_promotion:
+            san += "=" + move.promotion_choice
+    else:
+        # name the start file, rank or both when another piece of the same type can go to the same square
+        others = [other for other in valid_moves if other.piece_moved == move.piece_moved and
+                  (other.end_row, other.end_col) == (move.end_row, move.end_col) and other != move]
+        start_square = move.get_rank_file(move.start_row, move.start_col)
+        if not others:
+            disambiguation = ""
+        elif all(other.start_col != move.start_col for other in others):
+            disambiguation = start_square[0]
+        elif all(other.start_row != move.start_row for other in others):
+            disambiguation = start_square[1]
+        else:
+            disambiguation = start_square
+        san = piece + disambiguation + capture + end_square
+
+    gs.make_move(move)
+    if gs.in_check():
+        san += "+" if gs.has_legal_move() else "#"
+    gs.undo_move()
+    return san
+
+
+def format_game(headers, san_moves, result):
+    """Write a game in PGN, the movetext wrapped at 80 columns"""
+    lines = [f'[{name} "{value}"]' for name, value in headers.items()]
+    lines.append("")
+    tokens = []
+    for ply, san in enumerate(san_moves):
+        if ply % 2 == 0:
+            tokens.append(f"{ply // 2 + 1}.")
+        tokens.append(san)
+    tokens.append(result)
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,329 @@
+"""
+endgame tablebases: every position of an ending with a few pieces, solved by retrograde analysis
+
+a table holds one 16 bit value (native byte order) per position of a material signature such as KQvK,
+the stronger side always being white; positions with the colors swapped are looked up mirrored
+    0 for a draw, n > 0 when the side to move mates in n plies, -n - 1 when it gets mated in n plies
+the index of a position is the side to move followed by the squares of the pieces, 6 bits each,
+in the order of the signature; en passant is not part of the tables
+
+usage:
+    python tablebase.py                          generate the 3 piece tables into tablebases/
+    python tablebase.py KQvKR --dir tables       generate single tables (4 piece tables take hours)
+"""
+import argparse
+import mmap
+import os
+import sys
+import time
+from array import array
+
+from chess_engine import GameState, CAPTURED_SHIFT, END_SHIFT, PROMOTION_SHIFT, PROMOTION_PIECES
+from bitboard_engine import KNIGHT_ATTACKS, KING_ATTACKS, rook_attacks, bishop_attacks
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+PIECE_ORDER = "KQRBNP"  # order of the pieces of a side in a signature
+DRAW = 0
+ILLEGAL = -32768
+UNKNOWN = 32767  # not solved yet, only used while generating
+
+# generated in this order, as promotions of the pawn lead into the tables before it;
+# the endings with a lone minor piece are draws and need no table
+THREE_PIECE_SIGNATURES = ("KQvK", "KRvK", "KPvK")
+
+# kinds of the events of the retrograde analysis, stored as index * 4 + kind
+WIN_FOUND = 0  # a move to a lost position was found, so the position is won unless it already was
+LOSS_FOUND = 1  # the position was found lost
+MOVE_REFUTED = 2  # a move out of the table leads to a position the opponent wins
+
+
+def get_signature(pieces):
+    """Get the signature of a list of (piece, square), and whether the colors have to be swapped for it"""
+    white = "".join(sorted((piece[1] for piece, _ in pieces if piece[0] == "w"), key=PIECE_ORDER.index))
+    black = "".join(sorted((piece[1] for piece, _ in pieces if piece[0] == "b"), key=PIECE_ORDER.index))
+    if side_strength(black) > side_strength(white):
+        return black + "v" + white, True
+    return white + "v" + black, False
+
+
+def side_strength(letters):
+    """Compare the pieces of two sides: more pieces first, then the more valuable ones"""
+    return len(letters), [-PIECE_ORDER.index(letter) for letter in letters]
+
+
+def insufficient_material(signature):
+    """Check if neither side can ever mate: no pawns, rooks or queens and at most a minor piece each"""
+    white, black = signature.split("v")
+    return len(white) <= 2 and len(black) <= 2 and not any(letter in "PRQ" for letter in white + black)
+
+
+def position_index(pieces, white_to_move):
+    """Get the index of a position, the pieces being in the order of its signature"""
+    index = 0 if white_to_move else 1
+    for _, square in pieces:
+        index = index * 64 + square
+    return index
+
+
+def sort_pieces(pieces):
+    """Put a list of (piece, square) into the order of a signature"""
+    return sorted(pieces, key=lambda item: (item[0][0] != "w", PIECE_ORDER.index(item[0][1]), item[1]))
+
+
+class Tablebases:
+    """Tables of a directory, each one opened through mmap the first time it is probed"""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.tables = {}  # signature -> memoryview of the values, None until first probed
+        self.open_files = []
+        self.max_pieces = 0  # positions with more pieces cannot be in any table
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                signature, extension = os.path.splitext(name)
+                if extension == ".tb":
+                    self.tables[signature] = None
+                    self.max_pieces = max(self.max_pieces, len(signature) - 1)
+
+    def close(self):
+        for table, data, file in self.open_files:
+            table.release()
+            data.close()
+            file.close()
+        self.open_files = []
+        self.tables = dict.fromkeys(self.tables)
+
+    def get_table(self, signature):
+        """Get the values of a table, None if it was not generated"""
+        if signature not in self.tables:
+            return None
+        table = self.tables[signature]
+        if table is None:
+            file = open(os.path.join(self.directory, signature + ".tb"), "rb")
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            table = memoryview(data).cast("h")
+            self.open_files.append((table, data, file))
+            self.tables[signature] = table
+        return table
+
+    def probe(self, gs):
+        """Get the table value of a position, None if it is not in the tables"""
+        if gs.piece_count > self.max_pieces:
+            return None
+        board = gs.board
+        if gs.en_passant_possible:
+            # the tables know nothing about en passant, which only matters if a pawn can take
+            row, col = gs.en_passant_possible
+            pawn, pawn_row = ("wP", row + 1) if gs.white_to_move else ("bP", row - 1)
+            if (col > 0 and board[pawn_row][col - 1] == pawn) or (col < 7 and board[pawn_row][col + 1] == pawn):
+                return None
+        pieces = [(piece, row * 8 + col) for row in range(8) for col in range(8)
+                  if (piece := board[row][col]) != "--"]
+        return self.probe_pieces(pieces, gs.white_to_move)
+
+    def probe_pieces(self, pieces, white_to_move):
+        """Get the table value of the position of a list of (piece, square), None if it is not in the tables"""
+        signature, swap_colors = get_signature(pieces)
+        table = self.get_table(signature)
+        if table is None:
+            return DRAW if insufficient_material(signature) else None
+        if swap_colors:  # mirror the board top to bottom and swap the colors
+            pieces = [(("b" if piece[0] == "w" else "w") + piece[1], square ^ 56) for piece, square in pieces]
+            white_to_move = not white_to_move
+        return table[position_index(sort_pieces(pieces), white_to_move)]
+
+
+def generate_table(signature, directory=DEFAULT_DIRECTORY, out=sys.stdout):
+    """Solve every position of the signature and write its table, returning the number of won positions"""
+    start_time = time.perf_counter()
+    white, black = signature.split("v")
+    pieces = ["w" + letter for letter in white] + ["b" + letter for letter in black]
+    piece_total = len(pieces)
+    side_size = 64 ** piece_total
+    values = array("h", [UNKNOWN]) * (2 * side_size)
+    move_counts = array("B", bytes(2 * side_size))  # moves of a position not refuted yet
+    events = [[]]  # events[plies]: positions solved in that many plies, waiting to be passed on
+    tablebases = Tablebases(directory)  # the tables the moves out of this one lead into
+
+    gs = GameState()
+    gs.board = [["--"] * 8 for _ in range(8)]
+    gs.en_passant_possible = ()
+    moves = []
+
+    # forward pass: mark the illegal positions, count the moves of the others, solve the mates
+    # and schedule the moves that capture or promote, which leave the table
+    for index in range(2 * side_size):
+        squares = []
+        rest = index
+        for _ in range(piece_total):
+            rest, square = divmod(rest, 64)
+            squares.append(square)
+        squares.reverse()
+        white_to_move = rest == 0
+        if len(set(squares)) < piece_total or any(
+                piece[1] == "P" and square // 8 in (0, 7) for piece, square in zip(pieces, squares)):
+            values[index] = ILLEGAL
+            continue
+
+        for piece, square in zip(pieces, squares):
+            gs.board[square // 8][square % 8] = piece
+            if piece == "wK":
+                gs.white_king_location = (square // 8, square % 8)
+            elif piece == "bK":
+                gs.black_king_location = (square // 8, square % 8)
+        gs.white_to_move = not white_to_move
+        if gs.in_check():  # the side that just moved left its king in check
+            values[index] = ILLEGAL
+        else:
+            gs.white_to_move = white_to_move
+            gs.get_valid_moves(moves)
+            move_counts[index] = len(moves)
+            if gs.check_mate:
+                values[index] = -1
+                events[0].append(index * 4 + LOSS_FOUND)
+            elif gs.stale_mate:
+                values[index] = DRAW
+            for move in moves:
+                if move.value >> CAPTURED_SHIFT & 15 or move.is_pawn_promotion:
+                    schedule_exit(tablebases, events, index, move, pieces, squares, white_to_move)
+        for square in squares:
+            gs.board[square // 8][square % 8] = "--"
+
+    # backward pass: pass every solved position on to the positions one move before it, in the order
+    # of their distance to mate, so a win takes the fastest mate and a loss the slowest one
+    plies = 0
+    while plies < len(events):
+        for event in events[plies]:
+            index, kind = divmod(event, 4)
+            if kind == WIN_FOUND:
+                if values[index] != UNKNOWN:
+                    continue
+                values[index] = plies
+                for previous in previous_positions(index, pieces, side_size):
+                    refute_move(values, move_counts, events, previous, plies)
+            elif kind == LOSS_FOUND:
+                for previous in previous_positions(index, pieces, side_size):
+                    if values[previous] == UNKNOWN:
+                        add_event(events, plies + 1, previous * 4 + WIN_FOUND)
+            else:
+                refute_move(values, move_counts, events, index, plies)
+        events[plies] = None
+        plies += 1
+
+    # whatever was not solved can be held by the defending side
+    wins = 0
+    for index in range(2 * side_size):
+        if values[index] == UNKNOWN:
+            values[index] = DRAW
+        elif values[index] > 0:
+            wins += 1
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, signature + ".tb"), "wb") as table_file:
+        values.tofile(table_file)
+    print(f"{signature}: {wins} won positions, longest mate {plies - 1} plies, "
+          f"{time.perf_counter() - start_time:.1f}s", file=out)
+    return wins
+
+
+def schedule_exit(tablebases, events, index, move, pieces, squares, white_to_move):
+    """Schedule the result of a capture or promotion, which is looked up in the table it leads into"""
+    start_square = move.value & 63
+    end_square = move.value >> END_SHIFT & 63
+    after = []
+    for piece, square in zip(pieces, squares):
+        if square == end_square:
+            continue  # captured
+        if square == start_square:
+            if move.is_pawn_promotion:
+                piece = piece[0] + PROMOTION_PIECES[move.value >> PROMOTION_SHIFT & 7]
+            square = end_square
+        after.append((piece, square))
+    value = tablebases.probe_pieces(after, not white_to_move)
+    if value is None:
+        raise ValueError(f"the table of {get_signature(after)[0]} has to be generated first")
+    if value < 0:  # the opponent gets mated
+        add_event(events, -value, index * 4 + WIN_FOUND)
+    elif value > 0:  # the opponent mates
+        add_event(events, value, index * 4 + MOVE_REFUTED)
+
+
+def add_event(events, plies, event):
+    while len(events) <= plies:
+        events.append([])
+    events[plies].append(event)
+
+
+def refute_move(values, move_counts, events, index, plies):
+    """Take away a move of the position that leads to a win in plies for the opponent"""
+    if values[index] != UNKNOWN:
+        return
+    move_counts[index] -= 1
+    if move_counts[index] == 0:  # every move loses
+        values[index] = -(plies + 1) - 1
+        add_event(events, plies + 1, index * 4 + LOSS_FOUND)
+
+
+def previous_positions(index, pieces, side_size):
+    """Get the legal positions from which a quiet move of the side that just moved leads to the position"""
+    piece_total = len(pieces)
+    side, rest = divmod(index, side_size)
+    squares = []
+    for _ in range(piece_total):
+        rest, square = divmod(rest, 64)
+        squares.append(square)
+    squares.reverse()
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    empty = ~occupied
+    # the side that just moved is white when black is to move
+    mover = "w" if side == 1 else "b"
+    flipped = index + (side_size if side == 0 else -side_size)
+
+    for slot in range(piece_total):
+        piece = pieces[slot]
+        if piece[0] != mover:
+            continue
+        square = squares[slot]
+        piece_type = piece[1]
+        if piece_type == "K":
+            origins = KING_ATTACKS[square] & empty
+        elif piece_type == "N":
+            origins = KNIGHT_ATTACKS[square] & empty
+        elif piece_type == "R":
+            origins = rook_attacks(square, occupied) & empty
+        elif piece_type == "B":
+            origins = bishop_attacks(square, occupied) & empty
+        elif piece_type == "Q":
+            origins = (rook_attacks(square, occupied) | bishop_attacks(square, occupied)) & empty
+        else:  # pawns only move forward, so they came from behind
+            step = 8 if mover == "w" else -8
+            origins = 0
+            behind = square + step
+            if 0 <= behind < 64 and empty >> behind & 1:
+                origins = 1 << behind
+                double_row = 4 if mover == "w" else 3
+                if square // 8 == double_row and empty >> (behind + step) & 1:
+                    origins |= 1 << (behind + step)
+        weight = 64 ** (piece_total - 1 - slot)
+        while origins:
+            origin = (origins & -origins).bit_length() - 1
+            origins &= origins - 1
+            previous = flipped + (origin - square) * weight
+            if previous >= 0 and previous < 2 * side_size:
+                yield previous
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="generate endgame tablebases")
+    parser.add_argument("signatures", nargs="*", default=THREE_PIECE_SIGNATURES,
+                        help="material signatures such as KQvK, generated in the given order")
+    parser.add_argument("--dir", default=DEFAULT_DIRECTORY, help="directory to write the tables to")
+    args = parser.parse_args(argv)
+    for signature in args.signatures:
+        generate_table(signature, args.dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+headless self-play between two ChessAI settings, the games spread over a process pool
+every game is appended to the PGN file as soon as it is finished, and the match is summed up
+as an Elo difference with its 95% error bars
+
+usage:
+    python tournament.py --games 100 --engine-a "MAX_DEPTH=4,TIME_LIMIT=0.5" --engine-b "MAX_DEPTH=3"
+    python tournament.py --games 20 --workers 4 --pgn games.pgn
+"""
+import argparse
+import ast
+import math
+import multiprocessing
+import random
+import sys
+import time
+from datetime import date
+
+from chess_ai import ChessAI
+from chess_engine import GameState
+from pgn import move_to_san, format_game
+
+# the games already run in parallel, so every engine searches in its own process
+FORCED_SETTINGS = {"WORKERS": 1}
+# settings an engine does not give keep their values from before the match
+ORIGINAL_SETTINGS = {name: value for name, value in vars(ChessAI).items() if name.isupper()}
+
+
+def parse_settings(text):
+    """Read settings such as "MAX_DEPTH=4,TIME_LIMIT=0.5" into a dict of ChessAI attributes"""
+    settings = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if not hasattr(ChessAI, name) or not name.isupper():
+            raise ValueError(f"unknown ChessAI setting: {name}")
+        settings[name] = ast.literal_eval(value.strip())
+    return settings
+
+
+def is_insufficient_material(board):
+    """Check if neither side has the pieces left to mate: bare kings or a single minor piece"""
+    pieces = [piece[1] for row in board for piece in row if piece != "--" and piece[1] != "K"]
+    return len(pieces) == 0 or (len(pieces) == 1 and pieces[0] in "BN")
+
+
+def play_game(game):
+    """Play one game in a worker process and return its record"""
+    number, white, black, opening_seed, opening_plies, max_plies = game
+    players = {True: white, False: black}
+    names = set(white["settings"]) | set(black["settings"])
+    settings = {color: {**{name: player["settings"].get(name, ORIGINAL_SETTINGS[name]) for name in names},
+                        **FORCED_SETTINGS}
+                for color, player in players.items()}
+    # every engine keeps its own transposition table and evaluation caches, as their evaluations may differ
+    tables = {True: (None, None, None), False: (None, None, None)}
+    move_times = {white["name"]: [0.0, 0], black["name"]: [0.0, 0]}
+    gs = GameState()
+    san_moves = []
+    positions = {gs.zobrist_key: 1}
+
+    # a few random moves first, so the games do not all repeat each other
+    rng = random.Random(opening_seed)
+
+    result, termination = "1/2-1/2", "max plies"
+    for ply in range(max_plies):
+        valid_moves = gs.get_valid_moves()
+        if gs.check_mate:
+            result, termination = ("0-1" if gs.white_to_move else "1-0"), "checkmate"
+            break
+        if gs.stale_mate:
+            result, termination = "1/2-1/2", "stalemate"
+            break
+
+        if ply < opening_plies:
+            move = rng.choice(valid_moves)
+        else:
+            player = players[gs.white_to_move]
+            for name, value in settings[gs.white_to_move].items():
+                setattr(ChessAI, name, value)
+            ChessAI.transposition_table, ChessAI.eval_cache, ChessAI.pawn_table = tables[gs.white_to_move]
+            start = time.perf_counter()
+            move = ChessAI.find_best_move_min_max(gs, valid_moves)
+            move_times[player["name"]][0] += time.perf_counter() - start
+            move_times[player["name"]][1] += 1
+            tables[gs.white_to_move] = ChessAI.transposition_table, ChessAI.eval_cache, ChessAI.pawn_table
+
+        san_moves.append(move_to_san(gs, move, valid_moves))
+        gs.make_move(move)
+        positions[gs.zobrist_key] = positions.get(gs.zobrist_key, 0) + 1
+        if positions[gs.zobrist_key] >= 3:
+            result, termination = "1/2-1/2", "repetition"
+            break
+        if gs.halfmove_clock >= 100:
+            result, termination = "1/2-1/2", "fifty moves"
+            break
+        if is_insufficient_material(gs.board):
+            result, termination = "1/2-1/2", "insufficient material"
+            break
+
+    return {"number": number, "white": white["name"], "black": black["name"], "san_moves": san_moves,
+            "result": result, "termination": termination, "move_times": move_times}
+
+
+def elo_difference(wins, draws, losses):
+    """Get the Elo difference and the half width of its 95% confidence interval from a match score"""
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / games
+    # standard error of the mean score per game; the spread is taken with one more win and one more loss,
+    # worth a draw, so a match of nothing but draws, wins or losses does not claim an interval of zero
+    mean = (wins + 1 + draws / 2) / (games + 2)
+    variance = ((wins + 1) * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2 + (losses + 1) * mean ** 2) / (games + 2)
+    error = math.sqrt(variance / games)
+
+    def elo(p):
+        if p <= 0:
+            return -math.inf
+        if p >= 1:
+            return math.inf
+        return 400 * math.log10(p / (1 - p))
+
+    low, high = elo(score - 1.96 * error), elo(score + 1.96 * error)
+    return elo(score), (high - low) / 2
+
+
+def run_tournament(games, engine_a, engine_b, workers=1, pgn_path="tournament.pgn", max_plies=300,
+                   opening_plies=2, seed=None, out=sys.stdout):
+    """Play the games, alternating colors, and return (wins, draws, losses) of engine A"""
+    seed = random.randrange(1 << 32) if seed is None else seed
+    engine_a = {"name": "A", "settings": engine_a}
+    engine_b = {"name": "B", "settings": engine_b}
+    # two games in a row share their random opening, each engine playing it once with white
+    schedule = [(number + 1, *((engine_a, engine_b) if number % 2 == 0 else (engine_b, engine_a)),
+                 seed + number // 2, opening_plies, max_plies) for number in range(games)]
+
+    wins = draws = losses = 0
+    move_times = {"A": [0.0, 0], "B": [0.0, 0]}
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool, open(pgn_path, "a", encoding="utf-8") as pgn_file:
+        # games come back as they finish, so a slow game never holds up the others
+        for record in pool.imap_unordered(play_game, schedule):
+            headers = {"Event": "Self-play tournament", "Site": "?", "Date": date.today().strftime("%Y.%m.%d"),
+                       "Round": record["number"], "White": record["white"], "Black": record["black"],
+                       "Result": record["result"], "Termination": record["termination"]}
+            pgn_file.write(format_game(headers, record["san_moves"], record["result"]))
+            pgn_file.flush()
+
+            if record["result"] == "1/2-1/2":
+                draws += 1
+            elif (record["result"] == "1-0") == (record["white"] == "A"):
+                wins += 1
+            else:
+                losses += 1
+            for name, (seconds, moves) in record["move_times"].items():
+                move_times[name][0] += seconds
+                move_times[name][1] += moves
+            print(f"game {record['number']}: {record['white']} - {record['black']} {record['result']} "
+                  f"({record['termination']}), A +{wins} ={draws} -{losses}", file=out)
+
+    elapsed = time.perf_counter() - start_time
+    elo, margin = elo_difference(wins, draws, losses)
+    print(f"A vs B: +{wins} ={draws} -{losses}, Elo difference {elo:+.1f} +/- {margin:.1f}", file=out)
+    print(f"{games / elapsed * 3600:.1f} games/hour", file=out)
+    for name, (seconds, moves) in move_times.items():
+        print(f"{name}: {seconds / max(moves, 1):.3f}s per move over {moves} moves", file=out)
+    return wins, draws, losses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="play games between two ChessAI settings")
+    parser.add_argument("--games", type=int, default=10, help="number of games to play")
+    parser.add_argument("--engine-a", default="", help='settings of engine A, such as "MAX_DEPTH=4,TIME_LIMIT=0.5"')
+    parser.add_argument("--engine-b", default="", help="settings of engine B")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="games played at once")
+    parser.add_argument("--pgn", default="tournament.pgn", help="PGN file the games are appended to")
+    parser.add_argument("--max-plies", type=int, default=300, help="plies after which a game is a draw")
+    parser.add_argument("--opening-plies", type=int, default=2, help="random plies at the start of each game")
+    parser.add_argument("--seed", type=int, help="seed of the random openings")
+    args = parser.parse_args(argv)
+    try:
+        engine_a = parse_settings(args.engine_a)
+        engine_b = parse_settings(args.engine_b)
+    except (ValueError, SyntaxError) as error:
+        parser.error(str(error))
+    run_tournament(args.games, engine_a, engine_b, args.workers, args.pgn, args.max_plies, args.opening_plies,
+                   args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+UCI (universal chess interface) front end, so the engine can be used from chess GUIs and match runners
+it only needs chess_engine and chess_ai, so it starts without loading pygame
+
+usage:
+    python uci.py
+then, on stdin:
+    uci
+    position startpos moves e2e4 e7e5
+    go depth 6
+    go movetime 2000
+    go nodes 100000
+    go infinite
+    stop
+a search started with "go infinite" or "go ponder" only sends its bestmove after "stop" or "ponderhit"
+    quit
+"""
+import sys
+import threading
+
+from chess_ai import ChessAI, SearchContext
+from chess_engine import GameState, START_FEN
+
+ENGINE_NAME = "Chess"
+ENGINE_AUTHOR = "Chess authors"
+MOVES_TO_GO = 30  # moves the remaining clock time is split over when the GUI does not say
+
+
+class UciEngine:
+    """State of a UCI session: the current position and the search running on it"""
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.gs = GameState()
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        # set to let the search send its bestmove; held back by infinite and ponder searches until told
+        self.release_event = threading.Event()
+
+    def send(self, line):
+        self.out.write(line + "\n")
+        self.out.flush()
+
+    def handle(self, line):
+        """Handle one command, returning False on quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {ChessAI.TT_SIZE_MB} min 1 max 4096")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(arguments)
+        elif command == "ucinewgame":
+            self.wait()
+            ChessAI.get_transposition_table().clear()
+        elif command == "position":
+            self.wait()
+            self.set_position(arguments)
+        elif command == "go":
+            self.wait()
+            self.go(arguments)
+        elif command == "ponderhit":
+            self.release_event.set()  # the search goes on to its limits and answers as usual
+        elif command == "stop":
+            self.wait(stop=True)
+        elif command == "quit":
+            self.wait(stop=True)
+            return False
+        return True  # unknown commands are ignored, as the protocol asks
+
+    def set_option(self, arguments):
+        """Handle "setoption name <name> value <value>\""""
+        text = " ".join(arguments)
+        name, _, value = text.partition(" value ")
+        name = name.removeprefix("name ").strip().lower()
+        if name == "hash":
+            try:
+                ChessAI.TT_SIZE_MB = max(1, int(value))
+            except ValueError:
+                pass
+
+    def set_position(self, arguments):
+        """Handle "position [startpos | fen <fen>] [moves <move>...]\""""
+        moves_index = arguments.index("moves") if "moves" in arguments else len(arguments)
+        if arguments and arguments[0] == "fen":
+            fen = " ".join(arguments[1:moves_index])
+        else:
+            fen = START_FEN
+        try:
+            gs = GameState.from_fen(fen)
+        except ValueError as error:
+            self.send(f"info string invalid position: {error}")
+            return
+        for text in arguments[moves_index + 1:]:
+            move = next((move for move in gs.get_valid_moves() if move.get_uci_notation() == text), None)
+            if move is None:
+                self.send(f"info string illegal move: {text}")  # castling moves end up here too
+                break
+            gs.make_move(move)
+        self.gs = gs
+
+    def go(self, arguments):
+        """Handle "go", starting the search on a thread so that "stop" can still be read"""
+        limits = {}
+        for name, value in zip(arguments, arguments[1:]):
+            if name in ("depth", "movetime", "nodes", "wtime", "btime", "winc", "binc", "movestogo"):
+                try:
+                    limits[name] = int(value)
+                except ValueError:
+                    pass
+        # the killer moves and the transposition table hold no more than MAX_PLY - 1 plies
+        depth = min(max(limits.get("depth", SearchContext.MAX_PLY - 1), 1), SearchContext.MAX_PLY - 1)
+        node_limit = limits.get("nodes")
+        time_limit = None
+        if "movetime" in limits:
+            time_limit = limits["movetime"] / 1000
+        elif ("wtime" if self.gs.white_to_move else "btime") in limits:
+            # a share of the remaining clock time, plus the increment
+            clock = limits["wtime" if self.gs.white_to_move else "btime"]
+            increment = limits.get("winc" if self.gs.white_to_move else "binc", 0)
+            time_limit = max(clock / limits.get("movestogo", MOVES_TO_GO) + increment * 0.8, 10) / 1000
+            time_limit = min(time_limit, clock / 2000)
+
+        self.stop_event.clear()
+        if "infinite" in arguments or "ponder" in arguments:
+            self.release_event.clear()
+        else:
+            self.release_event.set()
+        self.search_thread = threading.Thread(target=self.search, args=(depth, time_limit, node_limit), daemon=True)
+        self.search_thread.start()
+
+    def search(self, depth, time_limit, node_limit):
+        gs = self.gs
+        valid_moves = gs.get_valid_moves()
+        if len(valid_moves) == 0:
+            best_text = "0000"
+        else:
+            _, best_move, _ = ChessAI.search(gs, valid_moves, depth, time_limit, node_limit, self.stop_event,
+                                             self.send_info)
+            if best_move is None:
+                best_move = valid_moves[0]  # stopped before the first iteration was done
+            best_text = best_move.get_uci_notation()
+        self.release_event.wait()  # the protocol forbids answering an infinite search before "stop"
+        self.send(f"bestmove {best_text}")
+
+    def send_info(self, depth, score, nodes, seconds, pv):
+        """Report a completed iteration of the search"""
+        if score > ChessAI.MATE_SCORE:
+            score_text = f"mate {(ChessAI.CHECKMATE_SCORE - score + 1) // 2}"
+        elif score < -ChessAI.MATE_SCORE:
+            score_text = f"mate -{(ChessAI.CHECKMATE_SCORE + score) // 2}"
+        else:
+            score_text = f"cp {score}"
+        pv_text = " ".join(move.get_uci_notation() for move in pv)
+        self.send(f"info depth {depth} score {score_text} nodes {nodes} nps {int(nodes / max(seconds, 1e-6))} "
+                  f"time {int(seconds * 1000)} pv {pv_text}")
+
+    def wait(self, stop=False):
+        """Wait for the running search to end, stopping it first if asked"""
+        if self.search_thread is None:
+            return
+        if stop or not self.release_event.is_set():
+            # a held search would never end on its own, so it is stopped whatever the command
+            self.stop_event.set()
+            self.release_event.set()
+        self.search_thread.join()
+        self.search_thread = None
+
+
+def main():
+    engine = UciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())